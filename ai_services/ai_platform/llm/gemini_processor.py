@@ -116,7 +116,8 @@ class GeminiProcessor:
             'top_p', 'top_k', 'max_output_tokens', 'stop_sequences', 'candidate_count',
             'presence_penalty', 'frequency_penalty', 'seed', 'response_logprobs', 'logprobs',
             'thinking_config',  # <--- [核心新增] 支持思考配置
-            'system_instruction'  # <--- 支持从 kwargs 传入系统指令
+            'system_instruction',  # <--- 支持从 kwargs 传入系统指令
+            'cached_content'  # <--- 支持引用显式上下文缓存 (见 create_context_cache)
         }
 
         for k, v in extra_kwargs.items():
@@ -180,6 +181,31 @@ class GeminiProcessor:
             self._log_error(e, "GenerateContent", timestamp)
             raise
 
+    def create_context_cache(self, model_name: str, content: str, ttl: str = "600s") -> str:
+        """
+        [Context Cache] 为多次调用共享的静态 Prompt 前缀创建显式上下文缓存。
+        返回缓存资源名，供 generate_content(..., cached_content=name) 引用。
+        注意: Gemini 对缓存内容有最小 Token 数要求，不满足时 API 会报错，由调用方决定是否降级。
+        """
+        def api_call():
+            return self._client.caches.create(
+                model=model_name,
+                config=types.CreateCachedContentConfig(
+                    contents=[types.Content(role="user", parts=[types.Part.from_text(text=content)])],
+                    ttl=ttl,
+                ),
+            )
+
+        cache, _ = self._retry_api_call(api_call, f"CacheCreate({model_name})")
+        return cache.name
+
+    def delete_context_cache(self, name: str):
+        """[Context Cache] 删除显式上下文缓存 (失败仅记录警告，缓存到期后会自动失效)"""
+        try:
+            self._client.caches.delete(name=name)
+        except Exception as e:
+            self.logger.warning(f"Failed to delete context cache '{name}': {e}")
+
     # -------------------------------------------------------------------------
     # 内部逻辑
     # -------------------------------------------------------------------------
@@ -84,9 +84,7 @@ class CharacterIdentifier(AIServiceMixin):
             self._load_localization_file(self.localization_path, lang)
 
             # 加载 NarrativeDataset
-            with enhanced_script_path.open(encoding='utf-8') as f:
-                raw_data = json.load(f)
-            dataset = NarrativeDataset(**raw_data)
+            dataset = NarrativeDataset.from_bytes(enhanced_script_path.read_bytes())
 
             # --- 步骤 2: 预处理 ---
             direct_scenes, mentioned_scenes = self._build_character_scene_index(dataset)
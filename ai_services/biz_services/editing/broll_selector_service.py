@@ -1,22 +1,44 @@
 # 文件路径: ai_services/editing/broll_selector_service.py
 # 描述: [重构后] B-Roll选择器服务，已完全解耦。
 # 版本: 4.0 (Decoupled & Integrated)
-import json
+import hashlib
 import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Literal, Optional, Tuple, Union
+
+import numpy as np
+import orjson
 
 # Core / Platform
 from ai_services.ai_platform.llm.gemini_processor import GeminiProcessor
-from core.exceptions import BizException, RateLimitException
+from core.exceptions import BizException
 from core.error_codes import ErrorCode
-from pydantic import ValidationError
+from pydantic import TypeAdapter, ValidationError
 
 # Schemas / Models
 from ai_services.biz_services.narrative_dataset import NarrativeDataset
 from .schemas import BrollSelectionLLMResponse, EditingServiceParams, EditingResult, EditingSequence, BrollClip
 
+_TIME_RE = re.compile(r"\s*(\d+):(\d+):(\d+(?:\.\d*)?)\s*$")
+_ID_RE = re.compile(r"\s*(?:ID-)?(\d+)\s*$")
+_NEWLINE_TO_PIPE = str.maketrans({'\n': ' | '})
+# LLM 响应校验器：模块级构建一次，复用已编译的 core schema
+_BROLL_RESP_ADAPTER = TypeAdapter(BrollSelectionLLMResponse)
+
+
+@dataclass(frozen=True, slots=True)
+class _Labels:
+    """[Internal] 预绑定的 UI 标签 (每次 execute 解析一次，供富文本构建复用)"""
+    no_cand: str
+    # 已烘焙标签的单行模板，仅剩 {i} / {d} / {c} 三个逐 clip 变量
+    group_line: str
+    single_line: str
+
 
 class BrollSelectorService:
     """
@@ -25,12 +47,22 @@ class BrollSelectorService:
     """
     SERVICE_NAME = "broll_selector_service"
 
+    # 本地化文件解析缓存 (path -> parsed json)，文件为静态资源，进程内共享
+    _LOCALIZATION_CACHE: Dict[str, Dict[str, Any]] = {}
+
+    # 选中片段超过该数量时，裁剪规划走 NumPy 向量化路径 (片段较少时标量循环更快)
+    _VECTORIZED_TRIM_MIN_CLIPS = 16
+
+    # 选中片段总时长与配音时长的允许偏差 (毫秒)，超出才触发裁剪/延长
+    _DURATION_TOLERANCE_MS = 100
+
     def __init__(self,
                  prompts_dir: Path,
                  logger: logging.Logger,
                  work_dir: Path,
                  localization_path: Path,
-                 gemini_processor: GeminiProcessor):
+                 gemini_processor: GeminiProcessor,
+                 llm_cache_dir: Optional[Path] = None):
         self.logger = logger
         self.work_dir = work_dir
         self.prompts_dir = prompts_dir
@@ -38,70 +70,103 @@ class BrollSelectorService:
         self.gemini_processor = gemini_processor
 
         self.labels = {}
+        # [Cache] Prompt 模板进程内缓存 (lang -> template)，模板为静态文件，无需失效
+        self._prompt_cache: Dict[str, str] = {}
+        # [Cache] LLM 选择结果的精确缓存 (prompt hash -> 已校验的响应)，持久化到 llm_cache_dir 以便重跑复用。
+        # 跨任务复用时应由调用方传入与任务无关的共享目录 (未指定时退化为 work_dir/.llm_cache，仅本任务内有效)
+        self._llm_cache: Dict[str, Dict[str, Any]] = {}
+        self._llm_cache_dir = Path(llm_cache_dir) if llm_cache_dir else Path(work_dir) / ".llm_cache"
 
     def _load_localization_file(self, path: Path, lang: str):
         try:
-            if path.exists():
-                with path.open('r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.labels = data.get(lang, data.get('en', {}))
-            else:
-                self.logger.warning(f"Localization file not found: {path}")
+            # [Cache] 解析结果按路径在进程内共享，后续 execute / 新实例直接复用
+            data = self._LOCALIZATION_CACHE.get(str(path))
+            if data is None:
+                if not path.exists():
+                    self.logger.warning(f"Localization file not found: {path}")
+                    return
+                data = orjson.loads(path.read_bytes())
+                self._LOCALIZATION_CACHE[str(path)] = data
+            self.labels = data.get(lang, data.get('en', {}))
         except Exception as e:
             self.logger.warning(f"Failed to load localization: {e}")
 
-    # ... (辅助方法 _time_str_to_seconds, _seconds_to_time_str 保持不变) ...
+    def _resolve_labels(self) -> _Labels:
+        """
+        [Helper] 从 self.labels 解析一次 UI 标签，提供英文硬编码作为最后的兜底。
+        """
+        type_group = self.labels.get('clip_type_group', 'Coherent Dialogue')
+        type_single = self.labels.get('clip_type_single', 'Single Dialogue')
+        duration = self.labels.get('duration_label', 'Duration')
+        summary = self.labels.get('content_summary_label', 'Content Summary')
+
+        # 格式: ID-0: [连贯对话] 时长: 5.2s, 内容摘要: A: 你好 | B: 你好
+        def line_template(clip_type: str) -> str:
+            esc = lambda t: t.replace('{', '{{').replace('}', '}}')
+            return f"ID-{{i}}: [{esc(clip_type)}] {esc(duration)}: {{d}}s, {esc(summary)}: {{c}}"
+
+        return _Labels(
+            no_cand=self.labels.get('no_candidates', '(No candidate clips)'),
+            group_line=line_template(type_group),
+            single_line=line_template(type_single),
+        )
+
     @staticmethod
     def _time_str_to_seconds(time_str: str) -> float:
-        try:
-            h, m, s = time_str.split(':')
-            return int(h) * 3600 + int(m) * 60 + float(s)
-        except:
+        """'HH:MM:SS.mmm' -> float seconds. 格式非法时返回 0.0 (单次正则匹配，不走异常路径)。"""
+        m = _TIME_RE.match(time_str) if time_str else None
+        if m is None:
             return 0.0
+        h, mi, sec = m.groups()
+        return int(h) * 3600 + int(mi) * 60 + float(sec)
 
     @staticmethod
-    def _seconds_to_time_str(seconds: float) -> str:
-        if seconds < 0: seconds = 0
-        td = timedelta(seconds=seconds)
-        minutes, sec = divmod(td.seconds, 60)
-        hours, minutes = divmod(minutes, 60)
-        return f"{hours:02d}:{minutes:02d}:{sec + td.microseconds / 1e6:06.3f}"
+    def _ms_to_time_str(total_ms: int) -> str:
+        """integer milliseconds -> 'HH:MM:SS.mmm' (纯整数算术格式化)。"""
+        if total_ms < 0: total_ms = 0
+        h, rem = divmod(total_ms, 3_600_000)
+        m, rem = divmod(rem, 60_000)
+        s, ms = divmod(rem, 1000)
+        return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
 
     def execute(self,
                 dubbing_data: Dict[str, Any],
                 dataset: NarrativeDataset,
-                config: EditingServiceParams) -> Dict[str, Any]:
+                config: EditingServiceParams,
+                return_format: Literal['dict', 'model'] = 'dict') -> Union[Dict[str, Any], EditingResult]:
+        """
+        return_format:
+        - 'dict': 返回 EditingResult.model_dump() (默认，兼容现有调用方)
+        - 'model': 直接返回 EditingResult，供只需落盘/转发结果的调用方用 to_bytes() 一步序列化，
+          跳过中间 dict 构建与二次 JSON 序列化
+        """
 
         self.logger.info(f"Starting B-Roll Selection (Lang: {config.default_lang})...")
 
         # 1. 加载 UI 标签
         self._load_localization_file(self.localization_path, config.default_lang)
+        labels = self._resolve_labels()
 
         # 2. 准备 Scene Map
         # key: str(scene_id), value: Scene Object
         scenes_map = dataset.scenes
 
-        # [Fix] 构建 Scene -> Chapter 的反向查找表
+        # [Fix] Scene -> Chapter 的反向查找表
         # NarrativeDataset V6 中，Chapter 包含 scene_ids，但 Scene 不包含 chapter_id
-        scene_to_chapter_map = {}
-        if dataset.chapters:
-            # 假设 dataset.chapters 是一个列表或字典
-            chapters_iter = dataset.chapters.values() if isinstance(dataset.chapters, dict) else dataset.chapters
-
-            for chapter in chapters_iter:
-                # 获取 Chapter UUID (兼容可能的命名差异)
-                c_uuid = getattr(chapter, "chapter_uuid", getattr(chapter, "uuid", None))
-                # 获取 Scene IDs
-                s_ids = getattr(chapter, "scene_ids", [])
+        # 该索引缓存在 dataset 实例上，同一数据集的多次 execute 不再重复构建
+        scene_to_chapter_map = dataset.scene_to_chapter_map
 
-                if c_uuid:
-                    for s_id in s_ids:
-                        scene_to_chapter_map[str(s_id)] = c_uuid
+        # [Cache] 候选池缓存 (仅在本次 execute 内有效)
+        # key: 排序后的 scene_id 元组。相邻解说词常引用同一组场景，命中时跳过对话遍历与分组。
+        # 候选池本身只读 (LLM 选择后会复制被选中的 clip 再微调)，因此可直接复用。
+        pool_cache: Dict[Tuple, List[Dict]] = {}
 
-        final_sequences: List[EditingSequence] = []
         input_script = dubbing_data.get("dubbing_script", [])
         total_items = len(input_script)
 
+        # 3. 构建候选池 (串行，开销小)
+        # jobs: (narration, duration, audio_path, candidate_pool)
+        jobs: List[Tuple[str, float, Optional[str], List[Dict]]] = []
         for i, entry in enumerate(input_script):
             self.logger.info(f"Processing sequence {i + 1}/{total_items}...")
 
@@ -114,26 +179,36 @@ class BrollSelectorService:
                 self.logger.warning(f"Skipping seq {i}: missing duration/scenes.")
                 continue
 
-            # 3. 构建候选池
-            candidate_pool = self._build_candidate_pool(source_scene_ids, scenes_map, config.gap_threshold)
+            pool_key = tuple(sorted(source_scene_ids))
+            candidate_pool = pool_cache.get(pool_key)
+            if candidate_pool is None:
+                candidate_pool = self._build_candidate_pool(pool_key, scenes_map, config.gap_threshold)
+                pool_cache[pool_key] = candidate_pool
 
             if not candidate_pool:
                 self.logger.warning(f"Skipping seq {i}: no candidates.")
-                final_sequences.append(EditingSequence(
+
+            jobs.append((narration_text, target_duration, audio_path, candidate_pool))
+
+        # 4. LLM 选择 (并发)
+        # 各序列相互独立，瓶颈是网络 RTT；以 config.parallelism 限制并发数，按提交顺序收集结果
+        llm_jobs = sum(1 for job in jobs if job[3])
+        with ThreadPoolExecutor(max_workers=max(1, min(config.parallelism, llm_jobs))) as executor:
+            futures = [
+                executor.submit(
+                    self._select_sequence_via_llm,
                     narration=narration_text,
-                    narration_duration=target_duration,
-                    narration_audio_path=audio_path,
-                    b_roll_clips=[]
-                ))
-                continue
+                    duration=target_duration,
+                    pool=candidate_pool,
+                    labels=labels,
+                    config=config
+                ) if candidate_pool else None
+                for narration_text, target_duration, _, candidate_pool in jobs
+            ]
 
-            # 4. LLM 选择
-            selected_clips_data = self._select_sequence_via_llm(
-                narration=narration_text,
-                duration=target_duration,
-                pool=candidate_pool,
-                config=config
-            )
+        final_sequences: List[EditingSequence] = []
+        for (narration_text, target_duration, audio_path, _), future in zip(jobs, futures):
+            selected_clips_data = future.result() if future else []
 
             # 5. 注入 Chapter ID (关键步骤：Edge端需要这个UUID)
             b_roll_clips_objs = []
@@ -141,7 +216,6 @@ class BrollSelectorService:
                 sid_str = str(clip_data['scene_id'])
 
                 # [Fix] 使用反向查找表获取 Chapter UUID
-                #chapter_uuid = scene_to_chapter_map.get(sid_str)
                 # 获取 UUID 对象
                 raw_uuid = scene_to_chapter_map.get(sid_str)
                 chapter_uuid_str = str(raw_uuid) if raw_uuid else None
@@ -149,14 +223,12 @@ class BrollSelectorService:
                 if not raw_uuid:
                     self.logger.warning(f"Scene {sid_str} does not belong to any chapter. Chapter ID will be None.")
 
-                # 构造 Pydantic 对象
-                clip_obj = BrollClip(
-                    **clip_data,
-                    chapter_id=chapter_uuid_str  # 传入字符串
-                )
-                b_roll_clips_objs.append(clip_obj)
+                # 构造 Pydantic 对象 (整数毫秒在此处一次性换算为秒)
+                b_roll_clips_objs.append(self._to_broll_clip(clip_data, chapter_uuid_str))
 
             # 6. 添加结果
+            # narration / duration / audio_path 来自外部 dubbing_data，序列保留完整校验；
+            # 内部构造的 BrollClip 已是模型实例，Pydantic 不会逐个重新校验
             final_sequences.append(EditingSequence(
                 narration=narration_text,
                 narration_duration=target_duration,
@@ -165,6 +237,8 @@ class BrollSelectorService:
             ))
 
         # 7. 封装最终结果
+        # generation_date / asset_name 来自外部输入，顶层保留完整校验；
+        # 嵌套的 EditingSequence 已在上方校验，Pydantic 不会逐个重新校验
         result = EditingResult(
             generation_date=dubbing_data.get("generation_date"),
             asset_name=dubbing_data.get("asset_name"),
@@ -172,39 +246,56 @@ class BrollSelectorService:
             total_sequences=len(final_sequences)
         )
 
+        if return_format == 'model':
+            return result
         return result.model_dump()
 
-    def _build_candidate_pool(self, scene_ids: List[int], scenes_map: Dict, gap_threshold: float) -> List[Dict]:
+    @staticmethod
+    def _to_broll_clip(clip_data: Dict[str, Any], chapter_id: Optional[str]) -> BrollClip:
+        """
+        [Helper] 内部 clip dict -> BrollClip。
+        内部以整数毫秒 (duration_ms / original_duration_ms) 计算，仅在输出边界换算为秒。
+        clip 由本服务生成、类型已确定，使用 model_construct 跳过校验。
+        """
+        original_ms = clip_data.get('original_duration_ms')
+        return BrollClip.model_construct(
+            type=clip_data['type'],
+            is_group=clip_data['is_group'],
+            scene_id=int(clip_data['scene_id']),
+            chapter_id=chapter_id,  # 传入字符串
+            content=clip_data['content'],
+            start_time=clip_data['start_time'],
+            end_time=clip_data['end_time'],
+            duration=clip_data['duration_ms'] / 1000,
+            original_duration=original_ms / 1000 if original_ms is not None else None
+        )
+
+    def _build_candidate_pool(self, scene_ids: Tuple, scenes_map: Dict, gap_threshold: float) -> List[Dict]:
         """
         构建候选池 (适配 V6 Dataset Object)
+        scene_ids 由调用方预先排序 (同时作为候选池缓存的 key)。
         """
         pool = []
-        # scene_ids 是 [101, 102]
-        for sid in sorted(scene_ids):
+        # scene_ids 是 (101, 102)
+        for sid in scene_ids:
             sid_str = str(sid)
             scene = scenes_map.get(sid_str)
             if not scene: continue
 
             # V6 Dataset: scene.dialogues 是 List[DialogueItem]
-            # 我们需要转成 dict list 或者直接操作 object
-            # 为了复用旧逻辑方便，这里做个简单的转换
-            dialogues = [d.model_dump() for d in scene.dialogues] if scene.dialogues else []
-            if not dialogues: continue
-
-            # ... (原来的分组逻辑，复用即可) ...
-            # 这里为节省篇幅略去分组算法细节，假设已复用 _format_clip_group
-            # 最终返回 list of dict
+            # [Perf] 直接读取模型属性 (不再 model_dump)，时间字符串只解析一次，
+            # 每条对话携带为 (start_sec, end_sec, DialogueItem)，后续分组/裁剪直接复用数值
+            if not scene.dialogues: continue
+            to_sec = self._time_str_to_seconds
+            dialogues = [(to_sec(d.start_time), to_sec(d.end_time), d) for d in scene.dialogues]
 
-            # [Copied Logic from original file]
             current_group = []
             scene_clips = []
             for dialogue in dialogues:
                 if not current_group:
                     current_group.append(dialogue)
                 else:
-                    prev_end = self._time_str_to_seconds(current_group[-1]['end_time'])
-                    curr_start = self._time_str_to_seconds(dialogue['start_time'])
-                    if curr_start - prev_end < gap_threshold:
+                    if dialogue[0] - current_group[-1][1] < gap_threshold:
                         current_group.append(dialogue)
                     else:
                         scene_clips.append(self._format_clip_group(current_group, sid))
@@ -215,36 +306,39 @@ class BrollSelectorService:
 
         return pool
 
-    def _format_clip_group(self, group: List[Dict], scene_id: int) -> Dict:
+    def _format_clip_group(self, group: List[Tuple[float, float, Any]], scene_id: int) -> Dict:
         """
         辅助函数：将一个对话组格式化为最终的clip对象。
+        group 中每项为 (start_sec, end_sec, DialogueItem)。
         scene_id现在被直接传入，不再需要反查。
         """
-        start_time = group[0]['start_time']
-        end_time = group[-1]['end_time']
-        duration = self._time_str_to_seconds(end_time) - self._time_str_to_seconds(start_time)
+        start_sec, _, first = group[0]
+        _, end_sec, last = group[-1]
 
         return {
             "type": "dialogue_group" if len(group) > 1 else "dialogue_single",
             "is_group": len(group) > 1,
             "scene_id": scene_id,
-            "content": "\n".join([f"{d['speaker']}: {d['content']}" for d in group]),
-            "start_time": start_time,
-            "end_time": end_time,
-            "duration": round(duration, 3)
+            "content": "\n".join([f"{d.speaker}: {d.content}" for _, _, d in group]),
+            "start_time": first.start_time,
+            "end_time": last.end_time,
+            # 时长类字段内部统一用整数毫秒表示，构造 BrollClip 时再换算为秒
+            "start_ms": int(round(start_sec * 1000)),
+            "duration_ms": int(round((end_sec - start_sec) * 1000))
         }
 
     def _select_sequence_via_llm(self,
                                  narration: str,
                                  duration: float,
                                  pool: List[Dict],
+                                 labels: _Labels,
                                  config: EditingServiceParams) -> List[Dict]:
         """
         [Core Logic] LLM 选择 + 时长自适应微调算法
         """
         # 1. 准备富文本列表 (供 LLM 阅读)
         # 这一步将结构化数据转为 Prompt 友好的文本
-        rich_list_str = self._build_rich_text(pool, config.default_lang)
+        rich_list_str = self._build_rich_text(pool, labels)
 
         # 2. 构建 Prompt
         # 加载对应的语言模板 (e.g., broll_sequence_selector_en.txt)
@@ -255,33 +349,35 @@ class BrollSelectorService:
             rich_candidate_list=rich_list_str
         )
 
-        # 3. LLM 推理
+        # 3. LLM 推理 (优先命中精确缓存：相同模型 + 相同 Prompt 直接复用上次的选择结果)
         try:
-            # 使用 config 中的模型配置
-            resp_data, _ = self.gemini_processor.generate_content(
-                model_name=config.default_model,
-                prompt=prompt,
-                temperature=0.1  # 保持低温，确保 ID 选择准确
-            )
+            cache_key = self._llm_cache_key(prompt, config) if config.llm_cache_enabled else None
+            resp_data = self._llm_cache_get(cache_key) if cache_key else None
+            is_fresh = resp_data is None
+            if is_fresh:
+                resp_data = self._generate(prompt, config)
 
             # 4. Schema 校验 (Pydantic)
             # 确保 LLM 返回的是 {"selected_ids": [...]} 格式
-            validated = BrollSelectionLLMResponse(**resp_data)
+            validated = _BROLL_RESP_ADAPTER.validate_python(resp_data)
+
+            # 只缓存通过校验的响应，避免把坏结果固化
+            if is_fresh and cache_key:
+                self._llm_cache_put(cache_key, validated.model_dump())
 
             # 5. ID 解析与映射
             # 假设 LLM 返回 ["ID-0", "ID-2"]
             selected_indices = []
             for sid in validated.selected_ids:
-                try:
-                    # 容错处理：提取数字 ID
-                    idx = int(sid.replace("ID-", "").strip())
-                    selected_indices.append(idx)
-                except ValueError:
+                # 容错处理：提取数字 ID (允许首尾空白及省略 "ID-" 前缀)
+                m = _ID_RE.match(sid)
+                if m is None:
                     self.logger.warning(f"Invalid ID format from LLM: {sid}")
                     continue
+                selected_indices.append(int(m.group(1)))
 
             # 映射回对象池 (Crucial: Use Copy)
-            # 必须复制对象，因为后续的微调算法会修改 duration/end_time
+            # 必须复制对象，因为后续的微调算法会修改 duration_ms/end_time
             # 如果不复制，会污染原始 candidate_pool，影响后续复用
             selected_clips = []
             for i in selected_indices:
@@ -303,44 +399,37 @@ class BrollSelectorService:
         # =========================================================
         # 这是为了解决 LLM 选出的片段总时长与配音时长不完全匹配的问题
 
-        actual_duration = sum(c['duration'] for c in selected_clips)
-        duration_delta = actual_duration - duration
-        min_clip_duration = 0.5  # 最小保留时长 0.5s，防止裁剪成 0
+        # 全程整数毫秒：求和为整数归约，偏差在容差 (±100ms) 内直接返回
+        delta_ms = sum(c['duration_ms'] for c in selected_clips) - int(round(duration * 1000))
+        if abs(delta_ms) <= self._DURATION_TOLERANCE_MS:
+            return selected_clips
 
-        # Case A: 选多了 (Overshoot) -> 需要裁剪
-        if duration_delta > 0.1:
-            overshoot_to_trim = duration_delta
+        min_clip_ms = 500  # 最小保留时长 0.5s，防止裁剪成 0
 
+        # Case A: 选多了 (Overshoot) -> 需要裁剪
+        if delta_ms > 0:
             # 策略：倒序裁剪 (从最后一个片段开始剪)，因为结尾通常不如开头重要
-            for clip in reversed(selected_clips):
-                if overshoot_to_trim <= 0:
-                    break
-
-                current_dur = clip['duration']
-                # 计算该片段最多能剪多少 (必须保留 min_clip_duration)
-                max_trimmable = current_dur - min_clip_duration
+            # 先规划每个片段的裁剪量，再一次性写回
+            overshoot_ms = delta_ms
+            durations_ms = [c['duration_ms'] for c in selected_clips]
+            if len(durations_ms) > self._VECTORIZED_TRIM_MIN_CLIPS:
+                trims = self._plan_trims_vectorized(durations_ms, overshoot_ms, min_clip_ms)
+            else:
+                trims = self._plan_trims(durations_ms, overshoot_ms, min_clip_ms)
 
-                if max_trimmable <= 0:
+            for clip, trim_ms in zip(selected_clips, trims):
+                if trim_ms <= 0:
                     continue
 
-                # 实际裁剪量
-                trim_amount = min(overshoot_to_trim, max_trimmable)
-
-                # 执行修改
-                new_duration = current_dur - trim_amount
-                clip['original_duration'] = current_dur  # 备份原始时长
-                clip['duration'] = round(new_duration, 3)
+                # 执行修改 (纯整数运算，无需逐步 round)
+                clip['original_duration_ms'] = clip['duration_ms']  # 备份原始时长
+                clip['duration_ms'] -= trim_ms
 
                 # 重新计算 end_time 字符串 (HH:MM:SS.mmm)
-                start_sec = self._time_str_to_seconds(clip['start_time'])
-                new_end_sec = start_sec + new_duration
-                clip['end_time'] = self._seconds_to_time_str(new_end_sec)
-
-                # 更新剩余需要裁剪的量
-                overshoot_to_trim -= trim_amount
+                clip['end_time'] = self._ms_to_time_str(clip['start_ms'] + clip['duration_ms'])
 
         # Case B: 选少了 (Undershoot) -> 需要延长
-        elif duration_delta < -0.1:
+        else:
             # 策略：延长最后一个片段 (Extend last clip)
             # 注意：这里只是在数据层面延长 duration。
             # 实际渲染时，如果素材本身不够长，通常会采用 Freeze Frame (定格) 或 Slow Motion
@@ -348,84 +437,153 @@ class BrollSelectorService:
             last_clip = selected_clips[-1]
 
             # 备份原始时长 (如果还没有备份过)
-            if 'original_duration' not in last_clip:
-                last_clip['original_duration'] = last_clip['duration']
-
-            missing_seconds = abs(duration_delta)
+            if 'original_duration_ms' not in last_clip:
+                last_clip['original_duration_ms'] = last_clip['duration_ms']
 
             # 执行修改
-            new_duration = last_clip['duration'] + missing_seconds
-            last_clip['duration'] = round(new_duration, 3)
+            last_clip['duration_ms'] -= delta_ms
 
             # 重新计算 end_time
-            start_sec = self._time_str_to_seconds(last_clip['start_time'])
-            new_end_sec = start_sec + new_duration
-            last_clip['end_time'] = self._seconds_to_time_str(new_end_sec)
+            last_clip['end_time'] = self._ms_to_time_str(last_clip['start_ms'] + last_clip['duration_ms'])
 
         return selected_clips
 
+    @staticmethod
+    def _plan_trims(durations: List[int], overshoot: int, min_clip_duration: int) -> List[int]:
+        """
+        [Helper] 标量版裁剪规划 (单位: 毫秒)：倒序遍历，每个片段最多裁到 min_clip_duration。
+        返回与 durations 对齐的裁剪量列表。
+        """
+        trims = [0] * len(durations)
+        for i in range(len(durations) - 1, -1, -1):
+            if overshoot <= 0:
+                break
+            # 计算该片段最多能剪多少 (必须保留 min_clip_duration)
+            max_trimmable = durations[i] - min_clip_duration
+            if max_trimmable <= 0:
+                continue
+            # 实际裁剪量
+            trims[i] = min(overshoot, max_trimmable)
+            # 更新剩余需要裁剪的量
+            overshoot -= trims[i]
+        return trims
+
+    @staticmethod
+    def _plan_trims_vectorized(durations: List[int], overshoot: int, min_clip_duration: int) -> List[int]:
+        """
+        [Helper] NumPy 版裁剪规划 (与 _plan_trims 等价)。
+        倒序前缀和给出每个片段之前已被后续片段吸收的裁剪量，剩余部分再按可裁剪量截断。
+        """
+        trimmable = np.maximum(np.asarray(durations, dtype=np.int64) - min_clip_duration, 0)
+        rev = trimmable[::-1]
+        absorbed_before = np.cumsum(rev) - rev
+        rev_trims = np.clip(overshoot - absorbed_before, 0, rev)
+        return rev_trims[::-1].tolist()
+
+    @staticmethod
+    def _llm_cache_key(prompt: str, config: EditingServiceParams) -> str:
+        """[Helper] 精确缓存 key：模型名 + 完整 Prompt 的 blake2b 摘要。"""
+        raw = f"{config.default_model}\n{prompt}".encode('utf-8')
+        return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+    def _llm_cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        """[Helper] 两级查找：进程内 dict -> llm_cache_dir/{key}.json"""
+        if key in self._llm_cache:
+            return self._llm_cache[key]
+
+        path = self._llm_cache_dir / f"{key}.json"
+        try:
+            if path.is_file():
+                data = orjson.loads(path.read_bytes())
+                self._llm_cache[key] = data
+                return data
+        except Exception as e:
+            self.logger.warning(f"Failed to read LLM cache entry {key}: {e}")
+        return None
+
+    def _llm_cache_put(self, key: str, data: Dict[str, Any]):
+        """[Helper] 写入内存并落盘 (临时文件 + 原子替换，多线程并发写入安全)"""
+        self._llm_cache[key] = data
+        try:
+            self._llm_cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self._llm_cache_dir / f"{key}.{threading.get_ident()}.tmp"
+            tmp_path.write_bytes(orjson.dumps(data))
+            os.replace(tmp_path, self._llm_cache_dir / f"{key}.json")
+        except Exception as e:
+            self.logger.warning(f"Failed to persist LLM cache entry {key}: {e}")
+
+    def _generate(self, prompt: str, config: EditingServiceParams) -> Any:
+        """
+        [Helper] 调用 LLM。限流 (429) 重试与退避由 GeminiProcessor._retry_api_call 统一处理，
+        此处不再叠加重试：最终仍限流时抛出 RateLimitException，由调用方降级为空选择。
+        """
+        resp_data, _ = self.gemini_processor.generate_content(
+            model_name=config.default_model,
+            prompt=prompt,
+            temperature=0.1  # 保持低温，确保 ID 选择准确
+        )
+        return resp_data
+
     def _load_prompt_template(self, lang: str) -> str:
         """
         [Helper] 加载 B-Roll 选择器的 Prompt 模板。
         支持语言回退机制 (Target Lang -> ZH -> Error)。
         """
+        # 0. 命中缓存则直接返回，避免每个序列重复 stat/read 磁盘
+        if lang in self._prompt_cache:
+            return self._prompt_cache[lang]
+
         # 1. 尝试加载目标语言模板
         # 文件名约定: broll_sequence_selector_{lang}.txt
         target_path = self.prompts_dir / f"broll_sequence_selector_{lang}.txt"
 
         if target_path.exists():
-            return target_path.read_text(encoding='utf-8')
+            template = target_path.read_text(encoding='utf-8')
+            self._prompt_cache[lang] = template
+            return template
 
         # 2. 回退到中文 (作为默认的基础模板)
+        if "zh" in self._prompt_cache:
+            template = self._prompt_cache["zh"]
+            self._prompt_cache[lang] = template
+            return template
+
         fallback_path = self.prompts_dir / "broll_sequence_selector_zh.txt"
         if fallback_path.exists():
             self.logger.info(f"Prompt template for '{lang}' not found. Falling back to 'zh'.")
-            return fallback_path.read_text(encoding='utf-8')
+            template = fallback_path.read_text(encoding='utf-8')
+            # 同时缓存到请求语言和 zh 下，后续未命中不再访问文件系统
+            self._prompt_cache[lang] = template
+            self._prompt_cache["zh"] = template
+            return template
 
         # 3. 如果连中文模板都没有，这是一个配置错误
         raise FileNotFoundError(f"Prompt templates not found in {self.prompts_dir}. Checked '{lang}' and 'zh'.")
 
-    def _build_rich_text(self, candidate_pool: List[Dict], lang: str) -> str:
+    def _build_rich_text(self, candidate_pool: List[Dict], labels: _Labels) -> str:
         """
         [Helper] 构建提供给 LLM 阅读的富文本素材列表。
 
         特性:
-        1. 使用 self.labels 中的本地化标签 (e.g. "连贯对话" vs "Coherent Dialogue")。
+        1. 使用 execute 中预解析的本地化标签 (e.g. "连贯对话" vs "Coherent Dialogue")。
         2. 将多行对话内容扁平化为单行 (用 " | " 分隔)，方便 Token 节省和 LLM 解析。
         3. 保留 ID 索引，供 LLM 引用。
         """
-        # 1. 获取 UI 标签 (self.labels 已经在 execute -> _load_localization_file 中加载完毕)
-        # 提供英文硬编码作为最后的兜底
-        lbl_no_cand = self.labels.get('no_candidates', '(No candidate clips)')
-        lbl_type_group = self.labels.get('clip_type_group', 'Coherent Dialogue')
-        lbl_type_single = self.labels.get('clip_type_single', 'Single Dialogue')
-        lbl_duration = self.labels.get('duration_label', 'Duration')
-        lbl_summary = self.labels.get('content_summary_label', 'Content Summary')
-
-        # 2. 处理空池情况
+        # 1. 处理空池情况
         if not candidate_pool:
-            return lbl_no_cand
+            return labels.no_cand
 
         lines = []
         for i, clip in enumerate(candidate_pool):
-            # 3. 判断素材类型 (对话组 vs 单句)
-            clip_type = lbl_type_group if clip.get('is_group') else lbl_type_single
+            # 2. 判断素材类型 (对话组 vs 单句)，选择已烘焙标签的行模板
+            line_tmpl = labels.group_line if clip['is_group'] else labels.single_line
 
-            # 4. 格式化内容摘要
+            # 3. 格式化内容摘要并组装单行描述
             # 核心逻辑: 将换行符替换为 " | " 分隔符，保留所有对话内容，同时保持单行格式
-            raw_content = clip.get('content', 'N/A')
-            # 确保 content 是字符串
-            if not isinstance(raw_content, str):
-                raw_content = str(raw_content)
-            content_summary = raw_content.replace('\n', ' | ')
-
-            # 5. 组装单行描述
-            # 格式: ID-0: [连贯对话] 时长: 5.2s, 内容摘要: A: 你好 | B: 你好
-            line = (
-                f"ID-{i}: [{clip_type}] "
-                f"{lbl_duration}: {clip.get('duration')}s, "
-                f"{lbl_summary}: {content_summary}"
-            )
-            lines.append(line)
+            lines.append(line_tmpl.format(
+                i=i,
+                d=clip['duration_ms'] / 1000,
+                c=clip['content'].translate(_NEWLINE_TO_PIPE)
+            ))
 
         return "\n".join(lines)
\ No newline at end of file
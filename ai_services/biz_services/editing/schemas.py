@@ -15,6 +15,8 @@ class EditingServiceParams(BaseModel):
 
     # 业务参数
     gap_threshold: float = Field(1.0, description="对话连贯性阈值 (秒)")
+    parallelism: int = Field(4, ge=1, le=16, description="LLM 选择的最大并发请求数 (受 API 速率限制约束)")
+    llm_cache_enabled: bool = Field(True, description="是否复用相同 Prompt 的 LLM 选择结果 (按媒资缓存于共享目录，跨任务重跑可命中)")
 
 
 class EditingTaskPayload(BaseModel):
@@ -76,4 +78,11 @@ class EditingResult(BaseModel):
 
     # 统计信息
     total_sequences: int
-    ai_total_usage: Dict[str, Any] = Field(default_factory=dict)
\ No newline at end of file
+    ai_total_usage: Dict[str, Any] = Field(default_factory=dict)
+
+    def to_bytes(self, indent: Optional[int] = None) -> bytes:
+        """
+        [Fast Serialize] 由 Rust 侧序列化器直接输出 JSON bytes (跳过 model_dump 中间 dict 与二次序列化)。
+        exclude_none: Optional 字段为 None 时不输出。
+        """
+        return self.__pydantic_serializer__.to_json(self, indent=indent, exclude_none=True)
\ No newline at end of file
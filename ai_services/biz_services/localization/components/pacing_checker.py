@@ -1,5 +1,6 @@
 import logging
-from typing import Dict, Any, Tuple, Optional
+import re
+from typing import Dict, Any, List, Tuple, Optional
 
 from ai_services.biz_services.narrative_dataset import NarrativeDataset
 
@@ -37,6 +38,11 @@ class LocalizationPacingChecker:
     # 兜底策略
     FALLBACK_STRATEGY = {"type": "word", "rate": 2.5}
 
+    # [Perf] 预编译计数器：避免 split() 产生中间列表 / join() 产生中间字符串
+    # 与 str.split() 的空白定义保持一致 (Unicode 空白字符全部位于 U+3000 及以下)
+    _WORD_RE = re.compile(r"\S+")
+    _WS_TABLE = dict.fromkeys(c for c in range(0x3001) if chr(c).isspace())
+
     def __init__(self,
                  dataset: NarrativeDataset,
                  target_lang: str,
@@ -51,6 +57,8 @@ class LocalizationPacingChecker:
         # 确定策略
         strategy = self.DEFAULT_RATES.get(self.target_lang, self.FALLBACK_STRATEGY)
         self.count_type = strategy["type"]
+        # 计数策略在初始化时绑定一次，check_pacing 热路径中不再分支
+        self._count_fn = self._count_words if self.count_type == "word" else self._count_chars
 
         # 确定语速 (用户指定的优先级 > 默认表)
         if user_speaking_rate and user_speaking_rate > 0:
@@ -63,24 +71,46 @@ class LocalizationPacingChecker:
 
         self.tolerance_ratio = float(tolerance_ratio)
 
+        # [Perf] 预计算场景时长表 (str(scene_id) -> duration)，check_pacing 中只做 dict 查找求和
+        self._scene_durs: Dict[str, float] = {
+            str(sid): getattr(scene, 'duration', 0.0) for sid, scene in self.dataset.scenes.items()
+        }
+
+    @classmethod
+    def _count_words(cls, text: str) -> int:
+        """简单分词 (对于大多数西方语言，空格分词足够估算)"""
+        return len(cls._WORD_RE.findall(text))
+
+    @classmethod
+    def _count_chars(cls, text: str) -> int:
+        """字符计数 (CJK)：移除所有空白字符，避免格式化造成的误差"""
+        return len(text.translate(cls._WS_TABLE))
+
     def check_pacing(self, snippet: Dict[str, Any]) -> Tuple[bool, Dict[str, Any]]:
         """
         检查翻译后的片段是否符合视觉时长。
         """
+        return self.check_pacing_with_duration(snippet)
+
+    def visual_duration(self, scene_ids: List[Any]) -> float:
+        """计算片段关联场景的视觉总时长 (未取整)；只依赖 scene_ids，文本精炼后可直接复用。"""
+        scene_durs = self._scene_durs
+        return sum(scene_durs.get(str(sid), 0.0) for sid in scene_ids)
+
+    def check_pacing_with_duration(self,
+                                   snippet: Dict[str, Any],
+                                   cached_duration: Optional[float] = None) -> Tuple[bool, Dict[str, Any]]:
+        """
+        检查翻译后的片段是否符合视觉时长。
+        cached_duration: 已由 visual_duration() 算出的视觉时长 (如 Refine 后复检)，传入时跳过场景求和。
+        """
         text = snippet.get("narration", "")
-        scene_ids = snippet.get("source_scene_ids", [])
 
         # 1. 计算视觉时长 (Visual Duration)
-        total_visual_duration = 0.0
-        found_ids = []
-
-        for sid in scene_ids:
-            sid_str = str(sid)
-            scene = self.dataset.scenes.get(sid_str)
-            if scene:
-                dur = getattr(scene, 'duration', 0.0)
-                total_visual_duration += dur
-                found_ids.append(sid)
+        if cached_duration is None:
+            total_visual_duration = self.visual_duration(snippet.get("source_scene_ids", []))
+        else:
+            total_visual_duration = cached_duration
 
         if total_visual_duration <= 0.1:
             # 无法获取时长，放行，但标记
@@ -94,15 +124,7 @@ class LocalizationPacingChecker:
             }
 
         # 2. 计算音频预估时长 (Audio Duration)
-        if self.count_type == "word":
-            # 简单分词 (对于大多数西方语言，空格分词足够估算)
-            # 过滤掉空字符串
-            count = len([w for w in text.split() if w.strip()])
-        else:
-            # 字符计数 (CJK)
-            # 移除所有空白字符，避免格式化造成的误差
-            count = len("".join(text.split()))
-
+        count = self._count_fn(text)
         pred_audio_duration = count / self.speaking_rate
 
         # 3. 判定
@@ -1,9 +1,12 @@
-import json
+import hashlib
 import logging
-import copy
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Callable, Dict, Any, List, Optional, Tuple
 
+import orjson
 from pydantic import ValidationError
 
 from ai_services.ai_platform.llm.gemini_processor import GeminiProcessor
@@ -19,6 +22,9 @@ from ai_services.biz_services.narration.schemas import NarrationSnippet
 
 logger = logging.getLogger(__name__)
 
+# 输出片段的字段白名单 (tts_instruct / narration_for_audio 等上游字段不进入本地化结果)
+_SNIPPET_FIELDS = tuple(NarrationSnippet.model_fields)
+
 
 class ContentLocalizer(AIServiceMixin):
     """
@@ -26,6 +32,16 @@ class ContentLocalizer(AIServiceMixin):
     Flow: Translate (Context Aware) -> Pacing Check -> Refine (Localization Specific)
     """
 
+    # [Cache] 进程级上下文缓存: 缓存键 -> (缓存资源名, 过期时间 monotonic)。
+    # 同一 Worker 内重复本地化同一份脚本 (重试 / 重跑) 时复用已上传的前缀，跨实例共享。
+    _CTX_CACHE: Dict[str, Tuple[str, float]] = {}
+    _CTX_CACHE_LOCK = threading.Lock()
+
+    # Refine 预算: 单片段最多精炼次数；复检溢出低于阈值 (秒) 即停止；每次重试目标长度收缩比例
+    _REFINE_MAX_ATTEMPTS = 2
+    _REFINE_OVERFLOW_EPS = 0.2
+    _REFINE_SHRINK_RATIO = 0.85
+
     def __init__(self,
                  gemini_processor: GeminiProcessor,
                  cost_calculator: CostCalculator,
@@ -37,15 +53,14 @@ class ContentLocalizer(AIServiceMixin):
         self.logger = logger
 
     def _load_prompt_template(self, lang: str, template_name: str) -> str:
-        """加载 Localization 业务包下的 Prompt"""
-        # 尝试 localization_refine_en.txt
-        path = self.prompts_dir / f"{template_name}_{lang}.txt"
-        if not path.exists() and lang != 'en':
-            path = self.prompts_dir / f"{template_name}_en.txt"
-
-        if path.exists():
-            return path.read_text(encoding='utf-8')
-        return ""
+        """
+        加载 Localization 业务包下的 Prompt (缺失时回退 en，仍缺失返回空串)。
+        [Cache] 复用 AIServiceMixin._read_template_file 的进程级 lru_cache，避免每次 execute 重复读盘。
+        """
+        try:
+            return self._read_template_file(self.prompts_dir, lang, template_name)
+        except FileNotFoundError:
+            return ""
 
     def execute(self,
                 master_script_data: Dict[str, Any],
@@ -78,63 +93,91 @@ class ContentLocalizer(AIServiceMixin):
             src_lang=config.source_lang,
             tgt_lang=config.target_lang,
             context=rag_context,
-            model=config.model
+            model=config.model,
+            config=config
         )
 
         # 3. 校验与精炼
-        final_script_objs = []
-
+        # [Perf] 第一轮: 同步执行 Pacing Check，收集需要精炼的片段
+        # 视觉时长只依赖 source_scene_ids，记录下来供 Refine 后复检直接复用
+        visual_durations = []
+        pacing_infos = []
+        refine_jobs = []
         for index, snippet in enumerate(translated_script):
-            # Sanitize
-            snippet["narration"] = snippet["narration"]
-
-            # Pacing Check
-            is_ok, info = pacing_checker.check_pacing(snippet)
+            visual_dur = pacing_checker.visual_duration(snippet.get("source_scene_ids", []))
+            is_ok, info = pacing_checker.check_pacing_with_duration(snippet, visual_dur)
+            visual_durations.append(visual_dur)
+            pacing_infos.append(info)
 
             if not is_ok and info['real_visual_duration'] > 0.1:
                 self.logger.warning(f"Snippet {index} overflow ({info['overflow_sec']}s). Refining...")
 
                 target_count = int(info["real_visual_duration"] * pacing_checker.speaking_rate)
                 safe_target_count = max(5, target_count)  # 至少5个单位
+                refine_jobs.append((index, snippet, info, safe_target_count))
+
+        # [Perf] 第二轮: Refine 是互相独立的 LLM 往返 (延迟受限)，并发提交。
+        # 线程池大小即并发上限，避免触发 Gemini 速率限制。
+        refine_results: Dict[int, Tuple[Optional[str], Optional[Dict[str, Any]], int]] = {}
+        if refine_jobs:
+            # 注: Refine 模板的静态前缀仅数十 Token，远低于 Gemini 最小缓存长度，不走上下文缓存
+            workers = min(config.parallelism, len(refine_jobs))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    pool.submit(
+                        self._refine_with_budget,
+                        refiner=refiner,
+                        pacing_checker=pacing_checker,
+                        prompt_template=refine_template,
+                        config=config,
+                        text=snippet["narration"],
+                        info=info,
+                        visual_duration=visual_durations[index],
+                        target_count=safe_target_count
+                    ): index
+                    for index, snippet, info, safe_target_count in refine_jobs
+                }
+                for future in as_completed(futures):
+                    index = futures[future]
+                    try:
+                        refine_results[index] = future.result()
+                    except Exception as e:
+                        self.logger.error(f"Refine failed at index {index}: {e}")
+                        refine_results[index] = (None, None, self._REFINE_MAX_ATTEMPTS)
+
+        # 第三轮: 按原顺序合并结果，并在主线程完成 Schema 校验
+        final_script_objs = []
 
-                refined_text = refiner.refine_content(
-                    content=snippet["narration"],
-                    prompt_template=refine_template,
-                    model_name=config.model,
-                    max_seconds=info["real_visual_duration"],
-                    # 这里的参数名最好在 Prompt 中也做相应兼容，或者我们统一传 target_length
-                    # 暂时为了兼容现有的 prompt 变量名 {max_chars}，我们把计算出的 单词数/字数 传进去
-                    # 但最好在 Prompt 里把 {max_chars} 改名为 {target_length} 并在 Prompt 里描述 unit
-                    max_chars=safe_target_count,
-                    style=""
-                )
+        for index, item in enumerate(translated_script):
+            info = pacing_infos[index]
 
+            # 白名单投影: 只保留 NarrationSnippet 的字段，替代逐个 pop 清理
+            snippet = {k: item[k] for k in _SNIPPET_FIELDS if k in item}
+
+            if index in refine_results:
+                refined_text, new_info, attempts = refine_results[index]
                 if refined_text:
                     snippet["narration"] = refined_text
-                    is_ok_now, new_info = pacing_checker.check_pacing(snippet)
                     info = new_info
-                    snippet["metadata"] = info
-                    snippet["metadata"]["refined"] = True
+                    info["refined"] = True
                 else:
-                    snippet["metadata"] = info
-                    snippet["metadata"]["validation_error"] = "Refine Failed"
-            else:
-                snippet["metadata"] = info
-
-            # 清理
-            snippet.pop("tts_instruct", None)
-            snippet.pop("narration_for_audio", None)
+                    info["validation_error"] = "Refine Failed"
+                info["refine_attempts"] = attempts
+            snippet["metadata"] = info
 
             # [Convert to Schema Object]
+            # 片段字段 (source_scene_ids 等) 来自外部 master_script 文件，始终完整校验
             try:
                 snippet_obj = NarrationSnippet(**snippet)
-                final_script_objs.append(snippet_obj)
             except Exception as e:
                 self.logger.error(f"Snippet Schema Validation Failed at index {index}: {e}")
                 # 即使失败也尽量不崩溃，可以跳过或记录错误
                 continue
+            final_script_objs.append(snippet_obj)
 
         # 4. 结果封装 (使用 LocalizationResult)
+        # generation_date / asset_name 等来自外部输入，保留完整校验；
+        # 嵌套的 NarrationSnippet 已在上方校验，Pydantic 不会逐个重新校验
         result = LocalizationResult(
             generation_date=master_script_data.get("generation_date"),
             asset_name=master_script_data.get("asset_name"),
@@ -146,10 +189,50 @@ class ContentLocalizer(AIServiceMixin):
             ai_total_usage={"note": "Localization + Refine"}
         )
 
-        return result.model_dump()
+        return result.model_dump(mode='python')
+
+    def _refine_with_budget(self,
+                            refiner: TextRefiner,
+                            pacing_checker: LocalizationPacingChecker,
+                            prompt_template: str,
+                            config: LocalizationServiceParams,
+                            text: str,
+                            info: Dict[str, Any],
+                            visual_duration: float,
+                            target_count: int) -> Tuple[Optional[str], Optional[Dict[str, Any]], int]:
+        """
+        [Worker] 有界精炼: 精炼后立即复检，仍明显溢出时收缩目标长度再试一次 (最多 _REFINE_MAX_ATTEMPTS 次)。
+        返回 (最后一次成功的精炼文本 或 None, 对应的复检 info, 实际尝试次数)。
+        """
+        best_text, best_info = None, None
+        attempt = 0
+        while attempt < self._REFINE_MAX_ATTEMPTS:
+            attempt += 1
+            refined_text = refiner.refine_content(
+                content=best_text or text,
+                prompt_template=prompt_template,
+                model_name=config.model,
+                max_seconds=info["real_visual_duration"],
+                # 这里的参数名最好在 Prompt 中也做相应兼容，或者我们统一传 target_length
+                # 暂时为了兼容现有的 prompt 变量名 {max_chars}，我们把计算出的 单词数/字数 传进去
+                # 但最好在 Prompt 里把 {max_chars} 改名为 {target_length} 并在 Prompt 里描述 unit
+                max_chars=target_count,
+                style=""
+            )
+            if not refined_text:
+                break
+
+            # 视觉时长复用首轮结果，只重算文本相关部分
+            _, new_info = pacing_checker.check_pacing_with_duration({"narration": refined_text}, visual_duration)
+            best_text, best_info = refined_text, new_info
+            if new_info["overflow_sec"] < self._REFINE_OVERFLOW_EPS:
+                break
+            target_count = max(5, int(target_count * self._REFINE_SHRINK_RATIO))
 
-    def _translate_script(self, script: List[Dict], src_lang: str, tgt_lang: str, context: str, model: str) -> List[
-        Dict]:
+        return best_text, best_info, attempt
+
+    def _translate_script(self, script: List[Dict], src_lang: str, tgt_lang: str, context: str, model: str,
+                          config: Optional[LocalizationServiceParams] = None) -> List[Dict]:
         """
         利用 RAG 上下文进行精准翻译
         """
@@ -170,41 +253,119 @@ class ContentLocalizer(AIServiceMixin):
             self.logger.error("Translator template missing.")
             return script
 
-        prompt = translator_template.format(
-            src_lang=src_lang,
-            tgt_lang=tgt_lang,
-            rag_context=context,
-            script_json=json.dumps(simplified_input, ensure_ascii=False, indent=2)
-        )
+        # [Perf] 紧凑序列化 (无缩进): 编码更快，且减少发送给 LLM 的空白 Token
+        script_json = orjson.dumps(simplified_input).decode("utf-8")
+        cache_name = None
+
+        # [Cache] 模板 + 语言 + RAG 上下文构成静态前缀，上传为上下文缓存后仅发送 script_json 段落。
+        # 缓存键由 RAG 上下文指纹 + 模板/语言组成，命中时无需渲染整段前缀。
+        if config and config.context_cache_enabled:
+            prefix_template, suffix_template = self._split_template_at(translator_template, "{script_json}")
+            cache_key = (f"translator:{prompt_lang}:{src_lang}:{tgt_lang}:"
+                         f"{self._fingerprint(prefix_template)}:{self._fingerprint(context)}")
+            cache_name = self._get_context_cache(
+                config, cache_key,
+                lambda: prefix_template.format(src_lang=src_lang, tgt_lang=tgt_lang, rag_context=context)
+            )
+
+        if cache_name:
+            prompt = suffix_template.format(script_json=script_json)
+        else:
+            prompt = translator_template.format(
+                src_lang=src_lang,
+                tgt_lang=tgt_lang,
+                rag_context=context,
+                script_json=script_json
+            )
 
         try:
             self.logger.info("Invoking LLM for Translation...")
             response_data, _ = self.gemini_processor.generate_content(
                 model_name=model,
                 prompt=prompt,
-                temperature=0.3
+                temperature=0.3,
+                cached_content=cache_name
             )
             translated_list = response_data.get("translated_script", [])
 
             # Map back by index
-            trans_map = {}
+            # [Perf] 索引空间为 0..N-1，直接按位置写入列表，合并时无需哈希查找
+            total = len(script)
+            trans_arr: List[Optional[str]] = [None] * total
             for t_item in translated_list:
                 try:
                     idx = int(t_item.get("index", -1))
-                    if idx >= 0:
-                        trans_map[idx] = t_item.get("narration", "")
+                    if 0 <= idx < total:
+                        trans_arr[idx] = t_item.get("narration", "")
                 except (ValueError, TypeError):
                     continue
 
             # Merge
-            merged_script = copy.deepcopy(script)
-            for i, item in enumerate(merged_script):
-                if i in trans_map:
+            # [Perf] 片段为扁平 dict，且下游只做键级赋值/删除，浅拷贝即可，无需 deepcopy 整棵结构
+            merged_script = [dict(item) for item in script]
+            for item, new_narration in zip(merged_script, trans_arr):
+                if new_narration is not None:
                     item["narration_source"] = item["narration"]  # 保留原文
-                    item["narration"] = trans_map[i]  # 更新为译文
+                    item["narration"] = new_narration  # 更新为译文
 
             return merged_script
 
         except Exception as e:
             self.logger.error(f"Translation failed: {e}. Returning original.")
-            return script
\ No newline at end of file
+            return script
+
+    @staticmethod
+    def _split_template_at(template: str, placeholder: str) -> Tuple[str, str]:
+        """
+        [Helper] 在包含 placeholder 的段落之前切分模板，返回 (前缀模板, 后缀模板)。
+        两段分别 format 后拼接与整体 format 结果一致；找不到占位符时前缀为空。
+        """
+        pos = template.find(placeholder)
+        if pos < 0:
+            return "", template
+        cut = template.rfind("\n\n", 0, pos)
+        cut = cut + 2 if cut >= 0 else 0
+        return template[:cut], template[cut:]
+
+    @staticmethod
+    def _fingerprint(text: str) -> str:
+        """[Helper] 内容指纹 (blake2b-128)，用于上下文缓存键"""
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _get_context_cache(self,
+                           config: LocalizationServiceParams,
+                           key: str,
+                           build_prefix: Callable[[], str]) -> Optional[str]:
+        """
+        [Helper] 按缓存键复用/创建 Gemini 上下文缓存；前缀仅在未命中时才构建。
+        前缀为空、过短 (低于模型最小缓存 Token 数) 或 API 失败时返回 None，调用方回退为发送完整 Prompt。
+        创建失败同样记入缓存 (空资源名)，有效期内不再重复发起注定失败的 API 调用。
+        """
+        key = f"{config.model}:{key}"
+        now = time.monotonic()
+        with self._CTX_CACHE_LOCK:
+            hit = self._CTX_CACHE.get(key)
+        if hit and hit[1] > now:
+            return hit[0] or None
+
+        prefix = build_prefix()
+        if not prefix.strip():
+            return None
+
+        try:
+            name = self.gemini_processor.create_context_cache(
+                model_name=config.model,
+                content=prefix,
+                ttl=f"{config.context_cache_ttl}s"
+            )
+        except Exception as e:
+            self.logger.warning(f"Context cache unavailable, sending full prompts instead: {e}")
+            with self._CTX_CACHE_LOCK:
+                self._CTX_CACHE[key] = ("", now + config.context_cache_ttl)
+            return None
+
+        # 预留 30s 余量，避免引用即将过期的缓存
+        with self._CTX_CACHE_LOCK:
+            self._CTX_CACHE[key] = (name, now + config.context_cache_ttl - 30)
+        self.logger.info(f"Created prompt context cache: {name}")
+        return name
@@ -23,6 +23,14 @@ class LocalizationServiceParams(BaseModel):
     speaking_rate: Optional[float] = Field(default=None, description="目标语言语速 (Word/sec 或 Char/sec)。不填则使用系统默认值。")
     tolerance_ratio: float = 0.1
 
+    # [Perf] Refine 并发度 (每个溢出片段一次独立 LLM 调用，受 API 速率限制约束)
+    parallelism: int = Field(default=4, ge=1, description="Refine 阶段的最大并发 LLM 请求数")
+
+    # [Cache] Prompt 静态前缀 (模板 + RAG 上下文) 上传为 Gemini 上下文缓存
+    context_cache_enabled: bool = Field(
+        default=False, description="是否将 Prompt 静态前缀上传为 Gemini 上下文缓存 (前缀需满足模型最小缓存 Token 数)")
+    context_cache_ttl: int = Field(default=600, ge=60, description="上下文缓存有效期 (秒)")
+
 
 class LocalizationTaskPayload(BaseModel):
     """
@@ -1,11 +1,34 @@
 import re
 import logging
-from typing import List, Dict, Any, Optional
-from collections import defaultdict
+from typing import List, Dict, Any, Optional, Tuple, Union
+from collections import defaultdict, namedtuple
+
+import numpy as np
 
 from ai_services.biz_services.narrative_dataset import NarrativeDataset, NarrativeFunction, StoryNode
 from ai_services.biz_services.narration.schemas import NarrationServiceConfig
 
+# [Perf] 预编译正则 (模块级共享，避免每个 Chunk 重复查找/解释 Pattern)
+# 推理事实块头部锚点，需与 rag/schemas.json 里的 inference_header 对应
+# zh: "---推理事实---", en: "--- Inferred Facts ---"
+_ANCHOR_RE = re.compile(r"---\s*(?:推理事实|Inferred Facts)\s*---", re.IGNORECASE)
+_SCENE_ID_RE = re.compile(r"(?:场景ID|Scene\s*ID)\s*[:：]\s*(\d+)", re.IGNORECASE)
+# [Perf] 单次扫描: 场景 ID 与推理事实锚点合并为一个 Pattern，分组阶段一遍同时拿到 ID 和锚点偏移
+_CHUNK_SCAN_RE = re.compile(
+    r"(?:场景ID|Scene\s*ID)\s*[:：]\s*(?P<sid>\d+)|(?P<anchor>---\s*(?:推理事实|Inferred Facts)\s*---)",
+    re.IGNORECASE
+)
+# [Perf] 排序过程中临时合成的节点 (无 storyline 或 storyline 未覆盖的场景) 只被本模块读取，
+# 使用轻量 namedtuple 代替 StoryNode，省去 Pydantic 构造/校验开销。字段与 StoryNode 的读取接口一致。
+_ScratchNode = namedtuple(
+    "_ScratchNode", "local_id narrative_index ref_scene_id narrative_function",
+    defaults=(None, NarrativeFunction.LINEAR)
+)
+_SortNode = Union[StoryNode, _ScratchNode]
+
+_ZH_DUP_COMMA_RE = re.compile(r"，\s*，")
+_EN_DUP_COMMA_RE = re.compile(r",\s*,")
+
 
 class ContextEnhancer:
     """
@@ -15,6 +38,9 @@ class ContextEnhancer:
     - [Surgical Injection]: 将叙事逻辑精准插入到 RAG 元数据块中。
     """
 
+    # 命中场景数超过该值时，排序走 NumPy argsort (节点较少时 Python sorted 更快)
+    _VECTORIZED_SORT_MIN_NODES = 64
+
     def __init__(self,
                  dataset: NarrativeDataset,
                  prompt_definitions: Dict,  # [New] 接收定义
@@ -22,7 +48,7 @@ class ContextEnhancer:
         self.logger = logger
         self.dataset = dataset
         self.prompt_definitions = prompt_definitions
-        self.logger.info(f"ContextEnhancer bound to asset: {dataset.project_metadata.asset_name}")
+        self.logger.info("ContextEnhancer bound to asset: %s", dataset.project_metadata.asset_name)
 
     def enhance(self, retrieved_chunks: List[Any], config: NarrationServiceConfig) -> str:
         if not retrieved_chunks:
@@ -46,8 +72,11 @@ class ContextEnhancer:
         # 3. 组装上下文 (传入语言参数)
         return self._assemble_context(sorted_nodes, scene_map, lang=config.lang)
 
-    def _assemble_context(self, sorted_nodes: List[StoryNode], scene_map: Dict[str, List[str]], lang: str) -> str:
-        parts = []
+    def _assemble_context(self, sorted_nodes: List[_SortNode], scene_map: Dict[str, List[Tuple[str, int]]],
+                          lang: str) -> str:
+        # [Perf] 所有片段 (含分隔符) 追加到同一个列表，最后一次 join，避免逐 Chunk / 逐场景拼接中间字符串
+        out = ["=== RETRIEVED CONTEXT (Narrative Sorted) ===\n", "\n"]
+        first_scene = True
 
         # 获取对应语言的定义，兜底 'zh'
         definitions = self.prompt_definitions.get(lang, self.prompt_definitions.get('zh', {}))
@@ -61,19 +90,20 @@ class ContextEnhancer:
             # [Step 1] 生成叙事脉络句子 (Narrative Line)
             narrative_line = self._build_narrative_line(node, narrative_defs)
 
-            # [Step 2] 处理每个 Chunk，执行精准插入
-            processed_chunks = []
-            for chunk_text in chunks:
-                injected_text = self._inject_narrative_line(chunk_text, narrative_line, lang)
-                processed_chunks.append(injected_text)
+            # [Step 2] 处理每个 Chunk，执行精准插入 (场景间空行分隔，Chunk 间换行分隔)
+            if not first_scene:
+                out.append("\n\n")
+            first_scene = False
 
-            scene_content = "\n".join(processed_chunks)
-            parts.append(scene_content)
+            for i, (chunk_text, anchor_idx) in enumerate(chunks):
+                if i:
+                    out.append("\n")
+                out.extend(self._inject_narrative_line(chunk_text, narrative_line, lang, anchor_idx))
 
-        header = "=== RETRIEVED CONTEXT (Narrative Sorted) ===\n"
-        return header + "\n" + "\n\n".join(parts) + "\n==================================="
+        out.append("\n===================================")
+        return "".join(out)
 
-    def _build_narrative_line(self, node: StoryNode, narrative_defs: Dict) -> str:
+    def _build_narrative_line(self, node: _SortNode, narrative_defs: Dict) -> str:
         """
         构建类似："本场景的叙事脉络是：Main 分支 第 5 幕，闪回片段，关联第 102 幕，这是一段过去的回忆。"
         """
@@ -105,39 +135,34 @@ class ContextEnhancer:
                 cue_desc=cue_desc
             )
             # 清理可能的连续逗号 (如果某些字段为空)
-            line = re.sub(r'，\s*，', '，', line)
-            line = re.sub(r',\s*,', ',', line)
+            line = _ZH_DUP_COMMA_RE.sub('，', line)
+            line = _EN_DUP_COMMA_RE.sub(',', line)
             return line
         except Exception:
             return f"Narrative Info: Seq {node.narrative_index}, {func_key}"
 
-    def _inject_narrative_line(self, chunk_text: str, narrative_line: str, lang: str) -> str:
+    def _inject_narrative_line(self, chunk_text: str, narrative_line: str, lang: str,
+                               anchor_idx: Optional[int] = None) -> Tuple[str, ...]:
         """
         [Surgical Injection]
         目标：插入到 "本场景的核心叙事是: ..." 之后，"---推理事实---" 之前。
         策略：寻找【推理事实块的头部】作为锚点，在它前面插入。
-        """
+        anchor_idx: 分组阶段已扫描出的锚点偏移 (-1 表示无锚点)；为 None 时现场查找。
 
-        # 定义可能的锚点 (Anchor)，支持中英文
-        # 这里的关键词要和 rag/schemas.json 里的 inference_header 对应
-        # zh: "---推理事实---", en: "--- Inferred Facts ---"
-
-        anchors = [
-            r"---推理事实---",
-            r"---\s*Inferred Facts\s*---",
-            r"---\s*推理事实\s*---"
-        ]
-
-        # 尝试寻找锚点
-        for anchor in anchors:
-            match = re.search(anchor, chunk_text, re.IGNORECASE)
-            if match:
-                start_idx = match.start()
-                # 在锚点之前插入
-                # 格式： 原文... \n [插入行] \n ---推理事实---
-                prefix = chunk_text[:start_idx].rstrip()
-                suffix = chunk_text[start_idx:]
-                return f"{prefix}\n{narrative_line}\n{suffix}"
+        返回按顺序拼接即为注入结果的字符串片段，由调用方统一 join。
+        """
+        # 尝试寻找锚点 (中英文锚点合并为单个预编译 Pattern，一次扫描)
+        if anchor_idx is None:
+            match = _ANCHOR_RE.search(chunk_text)
+            anchor_idx = match.start() if match else -1
+
+        if anchor_idx >= 0:
+            start_idx = anchor_idx
+            # 在锚点之前插入
+            # 格式： 原文... \n [插入行] \n ---推理事实---
+            prefix = chunk_text[:start_idx].rstrip()
+            suffix = chunk_text[start_idx:]
+            return prefix, "\n", narrative_line, "\n", suffix
 
         # [Fallback] 如果找不到锚点（比如该场景没有推理事实），则尝试追加到 Metadata 块末尾
         # 寻找第一个空行
@@ -145,44 +170,84 @@ class ContextEnhancer:
         if first_blank_line != -1:
             prefix = chunk_text[:first_blank_line]
             suffix = chunk_text[first_blank_line:]
-            return f"{prefix}\n{narrative_line}{suffix}"
+            return prefix, "\n", narrative_line, suffix
 
         # [Ultimate Fallback] 放在最前面
-        return f"{narrative_line}\n{chunk_text}"
+        return narrative_line, "\n", chunk_text
 
     # --- 辅助方法 (保持不变) ---
     def _get_chunk_text(self, chunk: Any) -> str:
-        if hasattr(chunk, 'text'): return chunk.text
-        if hasattr(chunk, 'page_content'): return chunk.page_content
-        if isinstance(chunk, dict): return chunk.get('text', chunk.get('content', ''))
+        # [Perf] RAG Context 对象绝大多数带 .text：直接取属性，缺失时再回退 (hasattr + 取值要查两次属性)
+        try:
+            return chunk.text
+        except AttributeError:
+            pass
+        try:
+            return chunk.page_content
+        except AttributeError:
+            pass
+        if isinstance(chunk, dict):
+            # 只在缺少 'text' 时才去取 'content' (原写法的默认值参数会被提前求值)
+            return chunk['text'] if 'text' in chunk else chunk.get('content', '')
         return str(chunk)
 
-    def _group_chunks_by_scene(self, chunks: List[Any]) -> Dict[str, List[str]]:
+    def _group_chunks_by_scene(self, chunks: List[Any]) -> Dict[str, List[Tuple[str, int]]]:
+        """按场景 ID 分组，值为 (chunk_text, 锚点偏移) 列表，供注入阶段直接切片"""
         scene_map = defaultdict(list)
         for chunk in chunks:
             text = self._get_chunk_text(chunk)
-            sid = self._extract_id_from_text(text)
+            sid, anchor_idx = self._scan_chunk(text)
             if sid:
-                scene_map[str(sid)].append(text)
+                scene_map[str(sid)].append((text, anchor_idx))
         return scene_map
 
+    @staticmethod
+    def _scan_chunk(text: str) -> Tuple[Optional[int], int]:
+        """
+        [Perf] 一次扫描同时提取首个场景 ID 与首个推理事实锚点偏移 (无锚点为 -1)，
+        两者都找到后立即停止，避免对同一 Chunk 分别跑两个正则。
+        """
+        sid = None
+        anchor_idx = -1
+        for match in _CHUNK_SCAN_RE.finditer(text):
+            if match.lastgroup == "sid":
+                if sid is None:
+                    sid = int(match.group("sid"))
+            elif anchor_idx < 0:
+                anchor_idx = match.start()
+            if sid is not None and anchor_idx >= 0:
+                break
+        return sid, anchor_idx
+
     def _extract_id_from_text(self, text: str) -> Optional[int]:
-        pattern = r"(?:场景ID|Scene\s*ID)\s*[:：]\s*(\d+)"
-        match = re.search(pattern, text, re.IGNORECASE)
+        match = _SCENE_ID_RE.search(text)
         return int(match.group(1)) if match else None
 
-    def _sort_by_storyline(self, scene_ids: List[str], branch_id: str) -> List[StoryNode]:
+    def _sort_by_storyline(self, scene_ids: List[str], branch_id: str) -> List[_SortNode]:
         branch = self.dataset.narrative_storyline.branches.get(branch_id)
         if not branch: return self._sort_by_physical_id(scene_ids)
-        node_map = {str(node.local_id): node for node in branch.nodes}
+        # 节点索引由 Dataset 懒加载并缓存，不再每次请求重建
+        node_map = self.dataset.branch_node_maps.get(branch_id, {})
         valid_nodes = []
         for sid in scene_ids:
             if sid in node_map:
                 valid_nodes.append(node_map[sid])
             else:
-                valid_nodes.append(StoryNode(local_id=int(sid), narrative_index=9999))
-        return sorted(valid_nodes, key=lambda n: n.narrative_index)
+                valid_nodes.append(_ScratchNode(local_id=int(sid), narrative_index=9999))
+        order = self._stable_order([n.narrative_index for n in valid_nodes])
+        return [valid_nodes[i] for i in order]
 
-    def _sort_by_physical_id(self, scene_ids: List[str]) -> List[StoryNode]:
-        sorted_ids = sorted(scene_ids, key=lambda x: int(x))
-        return [StoryNode(local_id=int(sid), narrative_index=i + 1) for i, sid in enumerate(sorted_ids)]
\ No newline at end of file
+    def _sort_by_physical_id(self, scene_ids: List[str]) -> List[_SortNode]:
+        order = self._stable_order([int(sid) for sid in scene_ids])
+        return [_ScratchNode(local_id=int(scene_ids[j]), narrative_index=i + 1) for i, j in enumerate(order)]
+
+    @classmethod
+    def _stable_order(cls, keys: List[int]) -> List[int]:
+        """
+        [Helper] 返回按 keys 升序的稳定排序下标 (与 sorted(..., key=...) 的顺序完全一致)。
+        节点较多时走 NumPy 稳定 argsort，避免逐元素的 Python key 函数调用。
+        """
+        if len(keys) > cls._VECTORIZED_SORT_MIN_NODES:
+            arr = np.fromiter(keys, dtype=np.int64, count=len(keys))
+            return np.argsort(arr, kind='stable').tolist()
+        return sorted(range(len(keys)), key=keys.__getitem__)
\ No newline at end of file
@@ -1,11 +1,22 @@
 import logging
-from typing import Dict, Any, Tuple, List
+import re
+from typing import Dict, Any, Tuple, List, Optional
+
+import numpy as np
 
 # [核心依赖] 强类型 Dataset
 from ai_services.biz_services.narrative_dataset import NarrativeDataset
+from ai_services.biz_services.narration.schemas import default_speaking_rate
 
 logger = logging.getLogger(__name__)
 
+# [Perf] 预编译分词正则 (与 str.split() 的空白定义一致)
+_WORD_RE = re.compile(r"\S+")
+
+
+def _count_words(text: str) -> int:
+    return len(_WORD_RE.findall(text))
+
 
 class NarrationPacingChecker:
     """
@@ -28,67 +39,149 @@ class NarrationPacingChecker:
 
         # 语言参数决定语速
         lang = params.get("lang", "zh")
-        default_rate = 3.0 if lang == 'zh' else 2.5
+        default_rate = default_speaking_rate(lang)
 
-        self.speaking_rate = float(service_params.get("speaking_rate", default_rate))
+        # 计数单位: 中文按字，其他语言按词 (与 speaking_rate 的单位对应)；计数函数在初始化时绑定一次
+        self.count_unit = "char" if lang == 'zh' else "word"
+        self._count_fn = len if lang == 'zh' else _count_words
+
+        # speaking_rate 可能为 None (未经 NarrationServiceConfig 解析的 dict)，此时回退到语言默认值
+        self.speaking_rate = float(service_params.get("speaking_rate") or default_rate)
+        # [Perf] 预计算语速倒数，单条预估时长只做一次乘法
+        self._inv_rate = 1.0 / self.speaking_rate
         self.tolerance_ratio = float(service_params.get("tolerance_ratio", 0.2))
 
+        # [Perf] 预计算场景时长表 (str(scene_id) -> duration)。duration 是 computed field，
+        # 每次访问都会重新解析 start/end 时间字符串；这里每个场景只解析一次，后续只做 dict 查找求和
+        self._scene_durs: Dict[str, float] = {
+            str(sid): getattr(scene, 'duration', 0.0) for sid, scene in self.dataset.scenes.items()
+        }
+
     def check_pacing(self, snippet: Dict[str, Any]) -> Tuple[bool, Dict[str, Any]]:
         """
         检查单条解说词的步调。
         """
-        text = snippet.get("narration", "")
-        scene_ids = snippet.get("source_scene_ids", [])
+        return self.check_pacing_with_duration(snippet)
 
+    def visual_duration(self, scene_ids: List[Any]) -> float:
+        """
+        计算片段关联场景的视觉总时长 (未取整)。
+        结果只依赖 scene_ids，文本精炼后可直接复用。
+        """
         total_visual_duration = 0.0
         found_ids = []
+        scene_durs = self._scene_durs
 
-        # [Object Access] 直接访问 Dataset 对象
         for sid in scene_ids:
             # Dataset V6 的 keys 是 str 类型
-            sid_str = str(sid)
-            scene = self.dataset.scenes.get(sid_str)
-
-            if scene:
-                # [Optimization] 直接使用 Computed Field 'duration'
-                # 如果 duration 为 0 (例如只有 start_time 无 end_time 的异常数据)，兜底为 0
-                dur = getattr(scene, 'duration', 0.0)
+            # 如果 duration 为 0 (例如只有 start_time 无 end_time 的异常数据)，兜底为 0
+            dur = scene_durs.get(str(sid))
+            if dur is not None:
                 total_visual_duration += dur
                 found_ids.append(sid)
-            else:
-                # 记录找不到的 ID，便于调试 (可能是 RAG 幻觉生成的 ID)
-                pass
+            # 找不到的 ID (可能是 RAG 幻觉生成的 ID) 体现在下方报警的 Found 列表中
 
         # 数据异常报警
         if total_visual_duration <= 0.1 and scene_ids:
             self.logger.warning(
-                f"⚠️ Zero Visual Duration detected: Snippet Scenes={scene_ids}, Found={found_ids}. "
-                "Skipping pacing check for this snippet."
+                "⚠️ Zero Visual Duration detected: Snippet Scenes=%s, Found=%s. "
+                "Skipping pacing check for this snippet.", scene_ids, found_ids
             )
 
+        return total_visual_duration
+
+    def check_pacing_with_duration(self,
+                                   snippet: Dict[str, Any],
+                                   cached_duration: Optional[float] = None) -> Tuple[bool, Dict[str, Any]]:
+        """
+        检查单条解说词的步调。
+        cached_duration: 已由 visual_duration() 算出的视觉时长 (如 Refine 后复检)，传入时跳过场景遍历，
+                         只重算文本相关的预估时长与溢出。
+        """
+        text = snippet.get("narration", "")
+        if cached_duration is None:
+            total_visual_duration = self.visual_duration(snippet.get("source_scene_ids", []))
+        else:
+            total_visual_duration = cached_duration
+
+        if total_visual_duration <= 0.1:
+            # 此时无法判断溢出，直接放行并在 metadata 标记 (时长为 0 时 Refiner 也救不了)。
+            # [Perf] 提前返回，跳过文本计数。
+            return True, self._zero_duration_info(total_visual_duration)
+
         # 估算语音时长
         # 简单估算，更精确的估算应由 TTS 引擎预处理提供，这里做业务级守门
-        char_count = len(text)  # 这里简化处理，英文应按单词算，但在业务守门层按字数+系数通常足够
-        pred_audio_duration = char_count / self.speaking_rate
+        char_count = self._count_fn(text)  # 中文为字数，其他语言为词数 (见 count_unit)
+        pred_audio_duration = char_count * self._inv_rate
 
-        # 计算限制
+        # 计算限制 (内部比较全部使用未取整的浮点数，仅在输出 info 时取整)
         duration_limit = total_visual_duration * (1 + self.tolerance_ratio)
         is_pacing_ok = pred_audio_duration <= duration_limit
+        overflow_sec = max(0.0, pred_audio_duration - duration_limit)
 
-        if total_visual_duration <= 0.1:
-            # 此时无法判断溢出，默认为 False 以避免错误 Refine，或者标记为 Skip
-            # 在业务上，如果时长为0，Refiner 也救不了，不如直接放行并在 metadata 标记
-            is_pacing_ok = True
-            overflow_sec = 0.0
-        else:
-            overflow_sec = max(0.0, pred_audio_duration - duration_limit)
+        return is_pacing_ok, self._pacing_info(
+            char_count, pred_audio_duration, total_visual_duration, duration_limit, overflow_sec, is_pacing_ok)
 
-        return is_pacing_ok, {
+    def check_pacing_batch(self,
+                           snippets: List[Dict[str, Any]]) -> Tuple[List[float], List[Dict[str, Any]], List[int]]:
+        """
+        [Perf] 整个脚本一次性检查：视觉时长/文本计数逐条收集后，时长预估与溢出判定用 NumPy 向量化完成。
+        与逐条调用 check_pacing_with_duration 的结果一致。
+
+        Returns:
+            (visual_durations, infos, overflow_indices)
+            overflow_indices 为溢出且视觉时长有效 (> 0.1s) 的片段下标，即需要 Refine 的片段。
+        """
+        n = len(snippets)
+        visual_list = [self.visual_duration(s.get("source_scene_ids", [])) for s in snippets]
+        visual = np.fromiter(visual_list, dtype=np.float64, count=n)
+        valid = visual > 0.1
+
+        # 视觉时长无效的片段跳过文本计数 (与单条检查的提前返回一致)
+        count_fn = self._count_fn
+        counts = np.fromiter(
+            (count_fn(s.get("narration", "")) if v > 0.1 else 0 for s, v in zip(snippets, visual_list)),
+            dtype=np.int64, count=n
+        )
+        pred = counts * self._inv_rate
+        limit = visual * (1 + self.tolerance_ratio)
+        ok = pred <= limit
+        overflow = np.maximum(0.0, pred - limit)
+
+        infos = []
+        for i, (is_valid, c, p, v, lim, over, is_ok) in enumerate(zip(
+                valid.tolist(), counts.tolist(), pred.tolist(), visual_list,
+                limit.tolist(), overflow.tolist(), ok.tolist())):
+            if is_valid:
+                infos.append(self._pacing_info(c, p, v, lim, over, is_ok))
+            else:
+                infos.append(self._zero_duration_info(v))
+
+        overflow_indices = np.flatnonzero(valid & ~ok).tolist()
+        return visual_list, infos, overflow_indices
+
+    def _zero_duration_info(self, total_visual_duration: float) -> Dict[str, Any]:
+        return {
+            "text_len": 0,
+            "count_unit": self.count_unit,
+            "pred_audio_duration": 0.0,
+            "real_visual_duration": round(total_visual_duration, 2),
+            "duration_limit": round(total_visual_duration * (1 + self.tolerance_ratio), 2),
+            "overflow_sec": 0.0,
+            "is_overflow": False,
+            "tolerance_ratio": self.tolerance_ratio,
+            "skip_reason": "zero_visual_duration"
+        }
+
+    def _pacing_info(self, char_count: int, pred_audio_duration: float, total_visual_duration: float,
+                     duration_limit: float, overflow_sec: float, is_pacing_ok: bool) -> Dict[str, Any]:
+        return {
             "text_len": char_count,
+            "count_unit": self.count_unit,  # 明确告知是 word 还是 char
             "pred_audio_duration": round(pred_audio_duration, 2),
             "real_visual_duration": round(total_visual_duration, 2),
             "duration_limit": round(duration_limit, 2),
             "overflow_sec": round(overflow_sec, 2),
             "is_overflow": not is_pacing_ok,
             "tolerance_ratio": self.tolerance_ratio
-        }
\ No newline at end of file
+        }
@@ -1,14 +1,26 @@
 # ai_services/narration/query_builder.py
 
-import json
 import logging
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, Any
 
+import orjson
+
 # [New] 引入强类型配置定义
 from ai_services.biz_services.narration.schemas import NarrationServiceConfig
 
 
+@lru_cache(maxsize=8)
+def _read_query_templates(template_path: str) -> Dict:
+    """
+    [Cache] 解析后的查询模板按路径进程级缓存，每个请求新建 QueryBuilder 时不再重复读盘/解析。
+    只读共享，调用方不得修改返回的 dict。异常不会被缓存。
+    """
+    with open(template_path, "rb") as f:
+        return orjson.loads(f.read())
+
+
 class NarrationQueryBuilder:
     def __init__(self, metadata_dir: Path, logger: logging.Logger):
         self.logger = logger
@@ -17,13 +29,12 @@ class NarrationQueryBuilder:
     def _load_templates(self, metadata_dir: Path) -> Dict:
         template_path = metadata_dir / "query_templates.json"
         if not template_path.is_file():
-            self.logger.warning(f"Query templates not found at {template_path}, using empty defaults.")
+            self.logger.warning("Query templates not found at %s, using empty defaults.", template_path)
             return {}
         try:
-            with template_path.open("r", encoding="utf-8") as f:
-                return json.load(f)
+            return _read_query_templates(str(template_path))
         except Exception as e:
-            self.logger.error(f"Failed to load query templates: {e}")
+            self.logger.error("Failed to load query templates: %s", e)
             return {}
 
     def _safe_format(self, template: str, **kwargs) -> str:
@@ -38,7 +49,7 @@ class NarrationQueryBuilder:
             except Exception:
                 return template
         except Exception as e:
-            self.logger.error(f"Format error: {e}")
+            self.logger.error("Format error: %s", e)
             return template
 
     # [Refactor] 接收 NarrationServiceConfig 对象
@@ -61,7 +72,7 @@ class NarrationQueryBuilder:
             custom_prompts = control.custom_prompts
             if custom_prompts and custom_prompts.narrative_focus:
                 base_template = custom_prompts.narrative_focus
-                self.logger.info(f"Using CUSTOM Narrative Focus: {base_template[:50]}...")
+                self.logger.info("Using CUSTOM Narrative Focus: %.50s...", base_template)
             else:
                 # Fallback (理论上 Validator 会拦截，这里做二次防御)
                 base_template = f"{asset_name}"
@@ -109,5 +120,5 @@ class NarrationQueryBuilder:
             fallback = f"{asset_name} story summary"
             return fallback
 
-        self.logger.info(f"🔍 [QueryBuilder] Generated Query: {final_query}")
+        self.logger.info("🔍 [QueryBuilder] Generated Query: %s", final_query)
         return final_query
\ No newline at end of file
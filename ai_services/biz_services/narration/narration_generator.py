@@ -1,9 +1,11 @@
-import json
 import logging
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional, Tuple
 
+import orjson
 from pydantic import ValidationError
 
 from ai_services.ai_platform.llm.base_generator import BaseRagGenerator
@@ -21,6 +23,15 @@ from .components.utils import sanitize_text
 from ai_services.ai_core_units.text_refiner.refiner import TextRefiner
 
 
+@lru_cache(maxsize=32)
+def _load_json_cached(path: str) -> Dict:
+    """
+    [Cache] 内部配置 (prompt_definitions / query_templates) 按路径进程级缓存，
+    每个请求新建 Generator 时不再重复读盘/解析。只读共享，调用方不得修改返回的 dict。
+    """
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
 
 class NarrationGenerator(BaseRagGenerator):
     """
@@ -53,11 +64,15 @@ class NarrationGenerator(BaseRagGenerator):
         # 加载内部配置
         self.prompt_definitions = self._load_internal_config("prompt_definitions.json")
         self.query_templates = self._load_internal_config("query_templates.json")
+        # QueryBuilder 无请求级状态，实例在生成器生命周期内复用
+        self._qb = NarrationQueryBuilder(self.metadata_dir, self.logger)
+        # [Perf] 预设 Prompt 目录 {(lang, category, key): content}，初始化时一次性展开 prompt_definitions
+        self._prompt_catalog = self._build_prompt_catalog(self.prompt_definitions)
 
     def _load_internal_config(self, filename: str) -> Dict:
         path = self.metadata_dir / filename
         if path.is_file():
-            with path.open(encoding="utf-8") as f: return json.load(f)
+            return _load_json_cached(str(path))
         return {}
 
     # --- 核心 Hook 实现 ---
@@ -67,18 +82,17 @@ class NarrationGenerator(BaseRagGenerator):
         try:
             # NarrativeDataset 实例化检查
             if "narrative_dataset" in config and isinstance(config["narrative_dataset"], dict):
-                config["narrative_dataset"] = NarrativeDataset(**config["narrative_dataset"])
+                config["narrative_dataset"] = NarrativeDataset.from_raw(config["narrative_dataset"])
 
             return NarrationServiceConfig(**config)
         except ValidationError as e:
-            self.logger.error(f"Config Validation Failed: {e}")
+            self.logger.error("Config Validation Failed: %s", e)
             raise ValueError(f"Invalid service configuration: {e}")
 
     def _build_query(self, config: NarrationServiceConfig) -> str:
         """Step 2: 构建 RAG 查询"""
-        qb = NarrationQueryBuilder(self.metadata_dir, self.logger)
         # [Refactor] 传入 Config 对象，不再 dump
-        return qb.build(config)  # asset_name 已包含在 config 中
+        return self._qb.build(config)  # asset_name 已包含在 config 中
 
     def _prepare_context(self, raw_chunks: List[Any], config: NarrationServiceConfig, **kwargs) -> str:
         """Step 4: 增强上下文"""
@@ -114,56 +128,72 @@ class NarrationGenerator(BaseRagGenerator):
                                                   config.control_params.custom_prompts)
 
         initial_script = llm_response.get("narration_script", [])
-        final_script = []
 
-        # 4. 循环处理
-        for index, snippet in enumerate(initial_script):
+        # 4. 第一轮: Sanitize 后整批执行 Pacing Check，收集需要精炼的片段
+        for snippet in initial_script:
             # Sanitize first
             if "narration" in snippet:
                 snippet["narration"] = sanitize_text(snippet["narration"])
 
-            # A. 检查步调 (Check Pacing)
-            is_ok, info = pacing_checker.check_pacing(snippet)
-
-            # 如果 OK 或者 视觉时长异常(0.0)，则直接通过
-            if is_ok or info['real_visual_duration'] <= 0.1:
-                snippet["metadata"] = info
-                final_script.append(snippet)
-                continue
-
-            # B. 溢出处理 (Refine Loop)
-            self.logger.warning(f"Snippet {index} overflow ({info['overflow_sec']}s). Calling TextRefiner...")
-
-            # 计算 Refiner 需要的参数
-            safe_max_chars = max(10, int(info["real_visual_duration"] * pacing_checker.speaking_rate))
-
-            refined_text = refiner.refine_content(
-                content=snippet["narration"],
-                prompt_template=refine_prompt_template,
-                model_name=config.model,
-                # kwargs for template
-                style=style_desc,
-                max_seconds=info["real_visual_duration"],
-                max_chars=safe_max_chars
-            )
-
+        # A. 检查步调 (Check Pacing)：视觉时长只依赖 source_scene_ids，Refine 后复检直接复用
+        # 如果 OK 或者 视觉时长异常(0.0)，则直接通过，不会出现在 overflow_indices 中
+        visual_durs, infos, overflow_indices = pacing_checker.check_pacing_batch(initial_script)
+        for snippet, info in zip(initial_script, infos):
+            snippet["metadata"] = info
+
+        # B. 溢出处理: 登记 Refine 任务
+        refine_jobs = []
+        for index in overflow_indices:
+            snippet = initial_script[index]
+            self.logger.warning("Snippet %d overflow (%ss). Calling TextRefiner...",
+                                index, snippet['metadata']['overflow_sec'])
+            refine_jobs.append((index, snippet, visual_durs[index]))
+
+        # [Perf] 第二轮: Refine 是互相独立的 LLM 往返 (延迟受限)，并发提交。
+        # 线程池大小即并发上限，避免触发 Gemini 速率限制。
+        refined_texts: Dict[int, Optional[str]] = {}
+        if refine_jobs:
+            workers = min(config.parallelism, len(refine_jobs))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    pool.submit(
+                        refiner.refine_content,
+                        content=snippet["narration"],
+                        prompt_template=refine_prompt_template,
+                        model_name=config.model,
+                        # kwargs for template
+                        style=style_desc,
+                        max_seconds=snippet["metadata"]["real_visual_duration"],
+                        # 字数预算基于未取整的视觉时长；max_seconds 仅用于提示词展示
+                        max_chars=max(10, int(visual_dur * pacing_checker.speaking_rate))
+                    ): index
+                    for index, snippet, visual_dur in refine_jobs
+                }
+                for future in as_completed(futures):
+                    index = futures[future]
+                    try:
+                        refined_texts[index] = future.result()
+                    except Exception as e:
+                        self.logger.error("Refine failed at index %d: %s", index, e)
+                        refined_texts[index] = None
+
+        # 第三轮: 合并 Refine 结果并复检
+        for index, snippet, visual_dur in refine_jobs:
+            refined_text = refined_texts.get(index)
             if refined_text:
                 snippet["narration"] = refined_text
                 # 复检
-                is_ok_now, new_info = pacing_checker.check_pacing(snippet)
+                is_ok_now, new_info = pacing_checker.check_pacing_with_duration(snippet, visual_dur)
                 snippet["metadata"] = new_info
                 snippet["metadata"]["refined"] = True
                 if not is_ok_now:
                     snippet["metadata"]["validation_error"] = "Still Overflow after Refine"
             else:
                 # Refine 失败，保留原样并标记
-                snippet["metadata"] = info
                 snippet["metadata"]["validation_error"] = "Refine Failed"
 
-            final_script.append(snippet)
-
         # 5. Result Packaging
-        script_objects = [NarrationSnippet(**item) for item in final_script]
+        script_objects = [self._build_snippet(item) for item in initial_script]
 
         result = NarrationResult(
             generation_date=datetime.now().isoformat(),
@@ -177,6 +207,33 @@ class NarrationGenerator(BaseRagGenerator):
 
     # --- 辅助方法 ---
 
+    @staticmethod
+    def _build_snippet(item: Dict[str, Any]) -> NarrationSnippet:
+        """
+        [Perf] 形态规整的片段 (非空 narration、int 场景 ID 列表) 走 model_construct 跳过逐字段校验；
+        其余情况回退到完整校验，保留类型转换与 "Empty narration" 报错。
+        """
+        narration = item.get("narration")
+        scene_ids = item.get("source_scene_ids")
+        source = item.get("narration_source")
+        if (isinstance(narration, str) and narration.strip()
+                and isinstance(scene_ids, list) and all(type(sid) is int for sid in scene_ids)
+                and (source is None or isinstance(source, str))
+                and isinstance(item.get("metadata", {}), dict)):
+            return NarrationSnippet.model_construct(**item)
+        return NarrationSnippet(**item)
+
+    def _load_prompt_template(self, lang: str, prompt_name: str) -> str:
+        """
+        加载 Narration 业务包下的 Prompt (缺失时回退 en，仍缺失返回空串)。
+        [Cache] 复用 AIServiceMixin._read_template_file 的进程级 lru_cache，避免每次请求重复读盘。
+        """
+        try:
+            return self._read_template_file(self.prompts_dir, lang, prompt_name)
+        except Exception as e:
+            self.logger.error("Failed to load template '%s': %s", prompt_name, e)
+            return ""
+
     def _assemble_prompt_string(self, context: str, config: NarrationServiceConfig) -> str:
         """Prompt 组装 (Type Safe)"""
         lang = config.lang
@@ -211,6 +268,19 @@ class NarrationGenerator(BaseRagGenerator):
             perspective=perspective, style=style, narrative_focus=focus + constraints, rag_context=context
         )
 
+    @staticmethod
+    def _build_prompt_catalog(prompt_definitions: Dict) -> Dict[Tuple[str, str, str], str]:
+        """将 {lang: {category: {key: content}}} 展开为 {(lang, category, key): content}"""
+        catalog = {}
+        for lang, lang_defs in prompt_definitions.items():
+            if not isinstance(lang_defs, dict): continue
+            for category, cat_defs in lang_defs.items():
+                if not isinstance(cat_defs, dict): continue
+                for key, content in cat_defs.items():
+                    if isinstance(content, str):
+                        catalog[(lang, category, key)] = content
+        return catalog
+
     def _resolve_prompt_content(self, lang: str, category: str, key: str, custom_obj: Any = None) -> str:
         """
         解析 Prompt 内容 (Strict Mode / Strategy A)
@@ -225,18 +295,16 @@ class NarrationGenerator(BaseRagGenerator):
             if category == "styles" and getattr(custom_obj, 'style', None): return custom_obj.style
             if category == "focus" and getattr(custom_obj, 'narrative_focus', None): return custom_obj.narrative_focus
 
-        # 2. 加载语言包
-        lang_defs = self.prompt_definitions.get(lang, {})
+        # 2. Preset (预展开目录，单次 dict 查找)
         # [Strict Option] 如果连语言都不支持，是否要报错？
         # 考虑到 i18n 配置可能滞后，这里通常保留 fallback 到 'zh' 的容错，
         # 但既然你要求严格，如果完全找不到该语言定义，也可以视为一种配置错误。
         # 这里我保留了对“语言”的最低限度容错（防止服务崩溃），但对“业务 Key”进行强校验。
-        if not lang_defs:
-            self.logger.warning(f"Language '{lang}' not found, falling back to 'zh'.")
-            lang_defs = self.prompt_definitions.get("zh", {})
+        if not self.prompt_definitions.get(lang):
+            self.logger.warning("Language '%s' not found, falling back to 'zh'.", lang)
+            lang = "zh"
 
-        cat_defs = lang_defs.get(category, {})
-        content = cat_defs.get(key, "")
+        content = self._prompt_catalog.get((lang, category, key), "")
 
         # 3. [Strategy A] 严格校验 (Strict Validation)
         # 如果既不是 Custom，又在 Preset 里找不到对应的 Prompt 内容，直接报错。
@@ -8,7 +8,7 @@ Narration Service Schemas.
 """
 from pathlib import Path
 from typing import List, Dict, Any, Optional, Literal
-from pydantic import BaseModel, Field, field_validator, ValidationInfo, ConfigDict
+from pydantic import BaseModel, Field, field_validator, model_validator, ValidationInfo, ConfigDict
 
 # [核心依赖] 引入公共数据基座
 # 确保此时 narrative_dataset.py 已经是那个 Strict Mode 的版本
@@ -89,6 +89,15 @@ class ControlParams(BaseModel):
 # 2. 服务配置契约 (Service Configuration)
 # ==============================================================================
 
+# 默认语速：中文按 字/秒，其他语言按 词/秒 (与 NarrationPacingChecker 的计数单位对应)
+DEFAULT_SPEAKING_RATES: Dict[str, float] = {"zh": 4.2}
+DEFAULT_WORD_SPEAKING_RATE = 2.5
+
+
+def default_speaking_rate(lang: str) -> float:
+    return DEFAULT_SPEAKING_RATES.get(lang, DEFAULT_WORD_SPEAKING_RATE)
+
+
 class NarrationServiceConfig(BaseModel):
     """
     [服务契约] Generator 上下文。
@@ -104,9 +113,15 @@ class NarrationServiceConfig(BaseModel):
     model: str = "gemini-2.5-flash"
     rag_top_k: int = Field(default=50, ge=1, le=200)
 
-    speaking_rate: float = 4.2
+    speaking_rate: Optional[float] = Field(
+        default=None, gt=0, description="语速 (中文 Char/sec，其他语言 Word/sec)。不填则按 lang 取系统默认值。")
+    # 按语言的默认语速表 (来自 ai_inference_config.yaml)，speaking_rate 未指定时按 lang 查找
+    speaking_rates: Dict[str, float] = Field(default_factory=dict)
     overflow_tolerance: float = Field(default=0.0)
 
+    # [Perf] Refine 并发度 (每个溢出片段一次独立 LLM 调用，受 API 速率限制约束)
+    parallelism: int = Field(default=4, ge=1, description="Refine 阶段的最大并发 LLM 请求数")
+
     control_params: ControlParams = Field(default_factory=ControlParams)
 
     # [核心联动] 强类型 Dataset
@@ -118,6 +133,14 @@ class NarrationServiceConfig(BaseModel):
         description="Strictly validated Narrative Dataset"
     )
 
+    @model_validator(mode='after')
+    def _resolve_speaking_rate(self):
+        # [Fix] 语速单位随 lang 变化 (字/秒 vs 词/秒)，未指定时按语言取默认值，
+        # 下游 (PacingChecker / Refine 预算 / target_chars) 统一读取解析后的值
+        if self.speaking_rate is None:
+            self.speaking_rate = self.speaking_rates.get(self.lang) or default_speaking_rate(self.lang)
+        return self
+
 # ==============================================================================
 # 3. 结果交付契约 (Output Definition)
 # ==============================================================================
@@ -6,13 +6,18 @@ Design Standards:
 1. [Strict Validation] All inputs strictly typed. Extra fields are forbidden (typo protection).
 2. [Normalized] Decoupled Scene/Chapter relationships.
 3. [Logical Integrity] StoryNode includes reference anchors (ref_scene_id).
-4. [Pydantic V2] Uses ConfigDict and computed_field for modern serialization.
+4. [Pydantic V2] Uses ConfigDict and validator-populated derived fields for modern serialization.
 """
 
+import sys
 import uuid
 from enum import Enum
-from typing import Dict, List, Optional
-from pydantic import BaseModel, Field, model_validator, ConfigDict, computed_field
+from functools import cached_property
+from typing import Annotated, Dict, List, Optional, Tuple
+from pydantic import (
+    BaseModel, Field, model_validator, field_validator, ConfigDict, BeforeValidator, AfterValidator,
+    TypeAdapter, ValidationError
+)
 
 # ==============================================================================
 # 0. 私有工具 (Private Helpers)
@@ -23,6 +28,17 @@ def _parse_timestamp(time_str: str) -> float:
     [Internal] 解析 'HH:MM:SS.mmm' -> float seconds.
     Fail-safe: returns 0.0 on error.
     """
+    # [Perf] 标准定宽格式 'HH:MM:SS(.mmm)' 按固定偏移切片，不分配 split 列表
+    if time_str and len(time_str) >= 8 and time_str[2] == ':' and time_str[5] == ':':
+        try:
+            return int(time_str[0:2]) * 3600 + int(time_str[3:5]) * 60 + float(time_str[6:])
+        except ValueError:
+            return 0.0
+    return _parse_timestamp_loose(time_str)
+
+
+def _parse_timestamp_loose(time_str: str) -> float:
+    """[Internal] 非定宽格式 (如 'H:MM:SS.mmm') 的兼容解析。Fail-safe: returns 0.0 on error."""
     if not time_str:
         return 0.0
     try:
@@ -33,6 +49,25 @@ def _parse_timestamp(time_str: str) -> float:
     except Exception:
         return 0.0
 
+_UUID_HEX_CHARS = frozenset("0123456789abcdefABCDEF")
+
+def _uuid_obj_to_str(value):
+    """[Internal] 兼容直接传入 uuid.UUID 对象的 Python 侧调用"""
+    return str(value) if isinstance(value, uuid.UUID) else value
+
+def _validate_uuid_shape(value: str) -> str:
+    """
+    [Internal] 校验 8-4-4-4-12 形态的 UUID 字符串 (不构造 uuid.UUID 对象)。
+    统一转小写，与 str(uuid.UUID(...)) 的规范输出保持一致。
+    """
+    if (len(value) != 36 or value[8] != '-' or value[13] != '-' or value[18] != '-' or value[23] != '-'
+            or not _UUID_HEX_CHARS.issuperset(value.replace('-', ''))):
+        raise ValueError(f"Invalid UUID string: {value!r}")
+    return value.lower()
+
+# [Perf] UUID 字段以规范字符串存储：形态校验即可，省去逐个构造 uuid.UUID 对象
+UUIDStr = Annotated[str, BeforeValidator(_uuid_obj_to_str), AfterValidator(_validate_uuid_shape)]
+
 # ==============================================================================
 # 1. 枚举类型 (Enums)
 # ==============================================================================
@@ -66,6 +101,11 @@ class SceneContentType(str, Enum):
     @classmethod
     def _missing_(cls, value): return cls.UNKNOWN
 
+# [Perf] 取值 -> 枚举成员映射 (导入时构建一次)：字段 before 校验器一次 dict 命中直接给出成员，
+# 非标准标签不再经过 Enum 查找失败 -> _missing_ 的异常路径
+_CAPTION_TYPE_MAP = {e.value: e for e in CaptionType}
+_SCENE_CONTENT_TYPE_MAP = {e.value: e for e in SceneContentType}
+
 class NarrativeFunction(str, Enum):
     LINEAR = "LINEAR"
     FLASHBACK = "FLASHBACK"       # Relative to ref_scene_id (Trigger)
@@ -80,8 +120,9 @@ class NarrativeFunction(str, Enum):
 class BaseSchema(BaseModel):
     """
     工程基类：禁止未知字段输入，防止拼写错误被静默忽略。
+    数据集加载后只读 (frozen)：extra='forbid' 下 __pydantic_extra__ 恒为 None，不为每个条目额外分配 dict。
     """
-    model_config = ConfigDict(extra='forbid')
+    model_config = ConfigDict(extra='forbid', frozen=True)
 
 class DialogueItem(BaseSchema):
     content: str = Field(..., description="台词内容")
@@ -95,6 +136,12 @@ class CaptionItem(BaseSchema):
     start_time: str = Field(...)
     end_time: str = Field(...)
 
+    @field_validator('type', mode='before')
+    @classmethod
+    def _coerce_type(cls, v):
+        # 与 CaptionType._missing_ 一致：未知类型归为 OTHER
+        return _CAPTION_TYPE_MAP.get(v, CaptionType.OTHER) if isinstance(v, str) else CaptionType.OTHER
+
 class HighlightItem(BaseSchema):
     description: str = Field(..., description="看点描述")
     type: HighlightType = Field(..., description="类型")
@@ -102,6 +149,24 @@ class HighlightItem(BaseSchema):
     end_time: str = Field(...)
     tags: List[str] = Field(..., description="标签(无则空列表)")
 
+    @field_validator('tags', mode='before')
+    @classmethod
+    def _normalize_tags(cls, v):
+        """入库时一次性规整标签列表：去首尾空白、去空、保序去重，下游无需重复清洗。
+        仅处理真正的 list；None / 字符串等非法输入原样交给类型校验报错 (Strict, 不做自动猜测)。"""
+        if not isinstance(v, list):
+            return v
+        seen = set()
+        out = []
+        for tag in v:
+            if isinstance(tag, str):
+                tag = tag.strip()
+                if not tag or tag in seen:
+                    continue
+                seen.add(tag)
+            out.append(tag)
+        return out
+
 # ==============================================================================
 # 3. 项目元数据 (Metadata)
 # ==============================================================================
@@ -121,9 +186,10 @@ class ProjectMetadata(BaseSchema):
 class NarrativeScene(BaseSchema):
     """
     [物理场景实体]
-    包含所有客观事实。使用 @computed_field 自动暴露秒级时间。
+    包含所有客观事实。秒级时间 (start_sec/end_sec/duration) 在校验结束时一次性算出。
     """
-    scene_uuid: uuid.UUID = Field(..., description="场景唯一ID")
+    # 不可变 (继承 BaseSchema 的 frozen)，保证派生的秒级时间与时间字符串始终一致
+    scene_uuid: UUIDStr = Field(..., description="场景唯一ID")
     local_id: int = Field(..., alias="id", description="内部数字ID")
 
     # Time (Source of Truth)
@@ -141,35 +207,44 @@ class NarrativeScene(BaseSchema):
     character_dynamics: str = Field(..., description="动态")
     mood_and_atmosphere: str = Field(..., description="氛围")
 
-    # --- Computed Properties (Pydantic V2 Style) ---
-    # 这些字段不会出现在 Input JSON 校验中，但在 dump() 时会自动计算并输出
-
-    @computed_field
-    @property
-    def start_sec(self) -> float:
-        return _parse_timestamp(self.start_time_str)
-
-    @computed_field
-    @property
-    def end_sec(self) -> float:
-        return _parse_timestamp(self.end_time_str)
-
-    @computed_field
-    @property
-    def duration(self) -> float:
-        s = self.start_sec
-        e = self.end_sec
-        return round(max(0.0, e - s), 3)
+    @field_validator('scene_content_type', mode='before')
+    @classmethod
+    def _coerce_content_type(cls, v):
+        # 与 SceneContentType._missing_ 一致：未知类型归为 UNKNOWN
+        return _SCENE_CONTENT_TYPE_MAP.get(v, SceneContentType.UNKNOWN) if isinstance(v, str) else SceneContentType.UNKNOWN
+
+    # --- Derived Times (computed once at validation end) ---
+    # [Perf] 普通字段而非 computed_field：computed_field 不做缓存，每次 dump() 都会重新求值；
+    # 这里在校验结束时解析一次，之后 dump() 直接输出浮点数。输入中若带有这些字段 (如读回自身 dump 产物) 会被重新计算覆盖。
+    start_sec: float = 0.0
+    end_sec: float = 0.0
+    duration: float = 0.0
+
+    @model_validator(mode='after')
+    def _fill_times(self):
+        s = _parse_timestamp(self.start_time_str)
+        e = _parse_timestamp(self.end_time_str)
+        # frozen 模型：绕过 __setattr__ 写入派生值
+        object.__setattr__(self, 'start_sec', s)
+        object.__setattr__(self, 'end_sec', e)
+        object.__setattr__(self, 'duration', round(max(0.0, e - s), 3))
+        return self
 
 class NarrativeChapter(BaseSchema):
     """
     [章节索引]
     Scene -> Chapter 关系的唯一维护者。
     """
-    chapter_uuid: uuid.UUID = Field(..., description="章节唯一ID")
+    chapter_uuid: UUIDStr = Field(..., description="章节唯一ID")
     local_id: int = Field(..., description="章节序号")
     name: str = Field(..., description="章节标题")
-    scene_ids: List[str] = Field(..., description="包含的场景ID列表")
+    scene_ids: tuple[str, ...] = Field(..., description="包含的场景ID列表")
+
+    @field_validator('scene_ids', mode='after')
+    @classmethod
+    def _intern_scene_ids(cls, v):
+        # [Perf] 紧凑存储：tuple 无 list 的预留空间；同一场景ID在各章节间驻留为同一个 str 对象
+        return tuple(sys.intern(s) for s in v)
 
 # ==============================================================================
 # 5. 逻辑层 (Logical Layer)
@@ -192,7 +267,8 @@ class StoryNode(BaseSchema):
 class StoryBranch(BaseSchema):
     branch_id: str = Field(default="main")
     name: str = Field(default="Main Story")
-    nodes: List[StoryNode] = Field(default_factory=list)
+    # 加载后只读 (BaseSchema frozen)：tuple 每元素一个指针，无 list 预留空间
+    nodes: tuple[StoryNode, ...] = Field(default_factory=tuple)
 
     parent_branch_id: Optional[str] = Field(default=None)
     divergence_index: Optional[int] = Field(default=None)
@@ -201,6 +277,26 @@ class NarrativeStoryline(BaseSchema):
     root_branch_id: str = Field(default="main")
     branches: Dict[str, StoryBranch] = Field(default_factory=dict)
 
+    @cached_property
+    def node_index(self) -> Dict[int, Tuple[str, int]]:
+        """
+        local_id -> (branch_id, 节点下标) 跨分支索引，首次访问时构建；同一 local_id 出现在多个分支时保留首次出现的位置。
+        惰性构建而非 after-validator，model_construct 构建的实例同样可用。
+        """
+        index: Dict[int, Tuple[str, int]] = {}
+        for branch_id, branch in self.branches.items():
+            for i, node in enumerate(branch.nodes):
+                index.setdefault(node.local_id, (branch_id, i))
+        return index
+
+    def find_node(self, local_id: int) -> Optional[StoryNode]:
+        """O(1) 按 local_id 查找节点，未找到返回 None"""
+        loc = self.node_index.get(local_id)
+        if loc is None:
+            return None
+        branch_id, i = loc
+        return self.branches[branch_id].nodes[i]
+
 # ==============================================================================
 # 6. 根数据集 (Root Dataset)
 # ==============================================================================
@@ -210,8 +306,8 @@ class NarrativeDataset(BaseSchema):
     [VSS Data Contract]
     Strict input validation. No auto-guessing.
     """
-    asset_uuid: uuid.UUID = Field(...)
-    project_uuid: uuid.UUID = Field(...)
+    asset_uuid: UUIDStr = Field(...)
+    project_uuid: UUIDStr = Field(...)
     project_metadata: ProjectMetadata = Field(...)
 
     # 1. Physical Layer (Mandatory)
@@ -219,4 +315,94 @@ class NarrativeDataset(BaseSchema):
     chapters: Dict[str, NarrativeChapter] = Field(..., description="Chapter Index")
 
     # 2. Logical Layer (Optional/Loose)
-    narrative_storyline: NarrativeStoryline = Field(default_factory=NarrativeStoryline)
\ No newline at end of file
+    narrative_storyline: NarrativeStoryline = Field(default_factory=NarrativeStoryline)
+
+    @model_validator(mode='after')
+    def _check_chapter_refs(self):
+        """
+        章节引用的场景必须存在于 scenes。一次遍历完成校验，并顺带填充 scene_to_chapter_map 缓存，
+        下游首次访问该索引时无需再遍历一遍章节。
+        """
+        # cached_property 的缓存即实例 __dict__ 中的同名项 (frozen 不影响直接写 __dict__)
+        self.__dict__['scene_to_chapter_map'] = _index_chapter_refs(self.scenes, self.chapters)
+        return self
+
+    # --- Derived Indexes (Lazy, cached per instance; not part of the serialized contract) ---
+
+    @classmethod
+    def from_raw(cls, data: Dict) -> "NarrativeDataset":
+        """
+        [Bulk Validation] 与 NarrativeDataset(**data) 同等严格，但 scenes / chapters 各用一个预编译的
+        List TypeAdapter 一次性校验，外层只校验剔除这两张大表后的"壳"，最后 model_construct 组装。
+        校验失败时回退到完整校验重新抛错，保证错误定位 (scenes.<key>.xxx) 与原路径一致。
+        """
+        if not (
+            isinstance(data, dict)
+            and isinstance(data.get("scenes"), dict) and isinstance(data.get("chapters"), dict)
+            and all(isinstance(k, str) for k in data["scenes"]) and all(isinstance(k, str) for k in data["chapters"])
+        ):
+            return cls.model_validate(data)
+        try:
+            scenes = dict(zip(data["scenes"].keys(), _SCENE_LIST_TA.validate_python(list(data["scenes"].values()))))
+            chapters = dict(zip(data["chapters"].keys(), _CHAPTER_LIST_TA.validate_python(list(data["chapters"].values()))))
+            shell = cls.model_validate({**data, "scenes": {}, "chapters": {}})
+            scene_to_chapter = _index_chapter_refs(scenes, chapters)
+        except (ValidationError, ValueError):
+            return cls.model_validate(data)
+        dataset = cls.model_construct(**{**dict(shell), "scenes": scenes, "chapters": chapters})
+        dataset.__dict__['scene_to_chapter_map'] = scene_to_chapter
+        return dataset
+
+    def to_bytes(self) -> bytes:
+        """
+        [Fast Serialize] 直接由 Rust 侧序列化器输出 JSON bytes (按别名，可被 from_bytes / from_raw 原样读回)，
+        不经过 model_dump 中间 dict，也不逐值在 Python 层转换枚举/UUID。
+        """
+        return self.__pydantic_serializer__.to_json(self, by_alias=True)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "NarrativeDataset":
+        """[Fast Load] JSON bytes 直接在 Rust 侧解析+严格校验，跳过 Python dict 中间层"""
+        return cls.model_validate_json(data)
+
+    @cached_property
+    def scene_to_chapter_map(self) -> Dict[str, str]:
+        """
+        Scene -> Chapter 反向索引 (key: str(scene_id), value: chapter_uuid)。
+        Scene 不持有 chapter_id；校验路径在引用检查时已一并填充，model_construct 构建的实例首次访问时由 chapters 构建。
+        """
+        return {
+            str(sid): chapter.chapter_uuid
+            for chapter in self.chapters.values()
+            for sid in chapter.scene_ids
+        }
+
+    @cached_property
+    def branch_node_maps(self) -> Dict[str, Dict[str, StoryNode]]:
+        """
+        Branch -> (str(local_id) -> StoryNode) 索引。
+        首次访问时由 narrative_storyline 构建，之后所有消费者共享；无 storyline 时为空 dict。
+        """
+        if not self.narrative_storyline:
+            return {}
+        return {
+            branch_id: {str(node.local_id): node for node in branch.nodes}
+            for branch_id, branch in self.narrative_storyline.branches.items()
+        }
+
+# [Perf] 模块级预编译：from_raw 批量校验场景/章节列表，避免每次调用重建 validator
+_SCENE_LIST_TA = TypeAdapter(List[NarrativeScene])
+_CHAPTER_LIST_TA = TypeAdapter(List[NarrativeChapter])
+
+def _index_chapter_refs(scenes: Dict[str, NarrativeScene], chapters: Dict[str, NarrativeChapter]) -> Dict[str, str]:
+    """
+    [Internal] 校验章节 -> 场景引用并构建 Scene -> Chapter 反向索引 (一次遍历，scenes 的 dict 成员判断 O(1))。
+    引用不存在的场景时抛出 ValueError。
+    """
+    index = {}
+    for chapter in chapters.values():
+        for sid in chapter.scene_ids:
+            if sid not in scenes:
+                raise ValueError(f"Chapter {chapter.chapter_uuid} references unknown scene {sid}")
+            index[sid] = chapter.chapter_uuid
+    return index
@@ -32,8 +32,21 @@ TRANSLATIONS = {
     }
 }
 
+# [Perf] 导入时展开为扁平表 {(lang, enum): term}，查询只需一次 dict 查找
+_FLAT_TRANSLATIONS = {
+    (lang, enum_val): term
+    for lang, terms in TRANSLATIONS.items()
+    for enum_val, term in terms.items()
+}
+
 def get_localized_term(enum_val, lang: str) -> str:
+    term = _FLAT_TRANSLATIONS.get((lang, enum_val))
+    if term is not None:
+        return term
     # 如果没传 lang，默认回退到 'en' 只是为了安全，
     # 但业务逻辑应该保证 lang 存在
-    target = TRANSLATIONS.get(lang, TRANSLATIONS.get("en", {}))
-    return target.get(enum_val, enum_val.value)
\ No newline at end of file
+    if lang not in TRANSLATIONS:
+        term = _FLAT_TRANSLATIONS.get(("en", enum_val))
+        if term is not None:
+            return term
+    return enum_val.value
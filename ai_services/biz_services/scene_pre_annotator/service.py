@@ -1,13 +1,15 @@
 import logging
-import json
+import math
 import time
 import os
+import orjson
 from pathlib import Path
 from typing import Dict, Any, List
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 
 from google import genai
 from google.genai import types
+from pydantic import TypeAdapter, ValidationError
 
 from ai_services.ai_platform.llm.mixins import AIServiceMixin
 from ai_services.ai_platform.llm.gemini_processor import GeminiProcessor
@@ -26,6 +28,9 @@ from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
+# [Perf] 模块级预编译：断点结果整批校验为 {slice_id: VisualAnalysisOutput}，并按同一 Schema 序列化追加记录
+_CKPT_RESULTS_ADAPTER = TypeAdapter(Dict[int, VisualAnalysisOutput])
+
 
 class ScenePreAnnotatorService(AIServiceMixin):
     SERVICE_NAME = "scene_pre_annotator"
@@ -34,9 +39,11 @@ class ScenePreAnnotatorService(AIServiceMixin):
     VISUAL_BATCH_SIZE = 15
     SEMANTIC_BATCH_SIZE = 500
 
-    # [文件持久化] 分别存储结果和消耗，确保断点续传时成本统计不丢失
-    RESULT_CACHE_FILE = "visual_inference_result_checkpoint.json"
-    USAGE_CACHE_FILE = "visual_inference_usage_checkpoint.json"
+    # [文件持久化] 追加式断点日志 (JSON Lines)：每个 Batch 一行，同时记录结果和消耗，确保断点续传时成本统计不丢失
+    CHECKPOINT_LOG_FILE = "visual_inference_checkpoint.jsonl"
+    # 旧版 (整文件重写) 断点：仅在断点日志不存在时读取一次并迁移进日志
+    LEGACY_RESULT_CACHE_FILE = "visual_inference_result_checkpoint.json"
+    LEGACY_USAGE_CACHE_FILE = "visual_inference_usage_checkpoint.json"
 
     def __init__(self, logger: logging.Logger, gemini_processor: GeminiProcessor, cost_calculator: CostCalculator):
         self.logger = logger
@@ -44,8 +51,9 @@ class ScenePreAnnotatorService(AIServiceMixin):
         self.cost_calculator = cost_calculator
         self.prompts_dir = Path(__file__).parent / "prompts"
 
-        self.result_cache_path = Path(__file__).parent / self.RESULT_CACHE_FILE
-        self.usage_cache_path = Path(__file__).parent / self.USAGE_CACHE_FILE
+        self.checkpoint_log_path = Path(__file__).parent / self.CHECKPOINT_LOG_FILE
+        self.legacy_result_cache_path = Path(__file__).parent / self.LEGACY_RESULT_CACHE_FILE
+        self.legacy_usage_cache_path = Path(__file__).parent / self.LEGACY_USAGE_CACHE_FILE
 
         try:
             self.project_id = getattr(settings, 'GOOGLE_CLOUD_PROJECT', os.getenv("GOOGLE_CLOUD_PROJECT"))
@@ -59,45 +67,109 @@ class ScenePreAnnotatorService(AIServiceMixin):
             self.logger.error(f"Failed to init Google GenAI Client: {e}")
             self.vertex_client = None
 
-    def _load_checkpoints(self) -> tuple[Dict[str, Any], Dict[str, Any]]:
-        """加载结果和Usage缓存"""
-        results = {}
+    def _load_checkpoints(self) -> tuple[Dict[int, VisualAnalysisOutput], Dict[str, Any]]:
+        """
+        回放断点日志：每行一条 Batch 记录，结果按 slice_id 合并、Usage 按 Batch Key 覆盖 (重复 Key 只计一次)。
+        崩溃时末尾可能留下半行，解析失败的行直接跳过。
+        """
+        raw_results = {}
         usages = {}
-        if self.result_cache_path.exists():
+        if not self.checkpoint_log_path.exists():
+            self._migrate_legacy_checkpoints()
+        if self.checkpoint_log_path.exists():
             try:
-                with open(self.result_cache_path, 'r', encoding='utf-8') as f:
-                    results = json.load(f)
+                with open(self.checkpoint_log_path, 'rb') as f:
+                    for line in f:
+                        try:
+                            record = orjson.loads(line)
+                        except orjson.JSONDecodeError:
+                            continue
+                        raw_results.update(record.get("results", {}))
+                        if record.get("batch") is not None:
+                            usages[record["batch"]] = record.get("usage", {})
             except:
                 pass
 
-        if self.usage_cache_path.exists():
+        return self._restore_visual_results(raw_results), usages
+
+    def _migrate_legacy_checkpoints(self):
+        """
+        [Upgrade] 旧版断点 (结果 / Usage 两个整文件) 转写为断点日志记录，升级后首次运行仍可续传。
+        结果整体写为一条无 batch 的记录，Usage 按原 Batch Key 逐条写入；迁移后旧文件不再读取。
+        """
+        legacy_paths = (self.legacy_result_cache_path, self.legacy_usage_cache_path)
+        if not any(p.exists() for p in legacy_paths):
+            return
+        results, usages = {}, {}
+        try:
+            if self.legacy_result_cache_path.exists():
+                results = orjson.loads(self.legacy_result_cache_path.read_bytes())
+            if self.legacy_usage_cache_path.exists():
+                usages = orjson.loads(self.legacy_usage_cache_path.read_bytes())
+        except Exception as e:
+            self.logger.warning(f"Legacy checkpoints unreadable, starting without them: {e}")
+            return
+        if not results and not usages:
+            return
+        try:
+            with open(self.checkpoint_log_path, 'ab') as f:
+                f.write(orjson.dumps({"batch": None, "results": results, "usage": {}}) + b"\n")
+                for batch_key, usage in usages.items():
+                    f.write(orjson.dumps({"batch": batch_key, "results": {}, "usage": usage}) + b"\n")
+        except Exception as e:
+            self.logger.warning(f"Failed to migrate legacy checkpoints: {e}")
+            return
+        self.logger.info(
+            f"Migrated legacy checkpoints ({len(results)} slices, {len(usages)} batches) into {self.CHECKPOINT_LOG_FILE}.")
+
+    @staticmethod
+    def _restore_visual_results(raw: Dict[str, Any]) -> Dict[int, VisualAnalysisOutput]:
+        """
+        断点结果整体一次校验；若有损坏条目则回退为逐条恢复，跳过坏条目 (与原容错行为一致)。
+        """
+        try:
+            return _CKPT_RESULTS_ADAPTER.validate_python(raw)
+        except ValidationError:
+            pass
+        restored = {}
+        for k, v in raw.items():
             try:
-                with open(self.usage_cache_path, 'r', encoding='utf-8') as f:
-                    usages = json.load(f)
+                restored[int(k)] = VisualAnalysisOutput(**v)
             except:
                 pass
-
-        return results, usages
-
-    def _save_checkpoints(self, results: Dict[str, Any], usages: Dict[str, Any]):
-        """双写缓存"""
+        return restored
+
+    def _append_checkpoint(self, log_fp, batch_res: Dict[int, VisualAnalysisOutput], batch_usage: Dict[str, Any]):
+        """
+        [Append-only] 每个 Batch 追加一行 (只写本 Batch 的结果)，写入量 O(batch) 而非 O(已完成总量)。
+        Usage 以该 Batch 的第一个 Slice ID 为 Key，防止回放时重复累加。
+        """
+        if not batch_res:
+            return
         try:
-            with open(self.result_cache_path, 'w', encoding='utf-8') as f:
-                json.dump(results, f, ensure_ascii=False)
-            with open(self.usage_cache_path, 'w', encoding='utf-8') as f:
-                json.dump(usages, f, ensure_ascii=False)
+            # [Perf] 结果段由 Adapter 直接序列化为 JSON bytes 后拼入记录，不经过中间 dict 再二次编码
+            record = b"".join((
+                b'{"batch":', orjson.dumps(str(next(iter(batch_res)))),
+                b',"results":', _CKPT_RESULTS_ADAPTER.dump_json(batch_res),
+                b',"usage":', orjson.dumps(batch_usage),
+                b'}\n',
+            ))
+            log_fp.write(record)
+            os.fsync(log_fp.fileno())
         except Exception as e:
             self.logger.warning(f"Failed to save checkpoints: {e}")
 
-    def _batch_visual_inference(self, slices: List[SliceInput], lang: str, model_name: str, video_title: str) -> Dict[
+    def _build_visual_instruction(self, lang: str, video_title: str) -> str:
+        """视觉推理指令只依赖 (lang, video_title)：每个任务构建一次，各 Batch 共享 (模板文件读取由 Mixin 缓存)"""
+        prompt_tpl = self._load_prompt_template(self.prompts_dir, lang, "visual_inference")
+        return prompt_tpl.format(video_title=video_title)
+
+    def _batch_visual_inference(self, slices: List[SliceInput], instruction: str, model_name: str) -> Dict[
         int, VisualAnalysisOutput]:
         if not self.vertex_client: return {}, {}
         valid_slices = [s for s in slices if s.frames]
         if not valid_slices: return {}, {}
 
-        prompt_tpl = self._load_prompt_template(self.prompts_dir, lang, "visual_inference")
-        instruction = prompt_tpl.format(video_title=video_title)
-
         contents = [instruction]
         for s in valid_slices:
             contents.append(f"\n--- Slice ID: {s.slice_id} ---")
@@ -153,6 +225,59 @@ class ScenePreAnnotatorService(AIServiceMixin):
 
         return {}, {}
 
+    @staticmethod
+    def _annotate_slice(slice_item: SliceInput, vis_res) -> AnnotatedSliceResult:
+        return AnnotatedSliceResult(
+            slice_id=slice_item.slice_id,
+            start_time=slice_item.start_time,
+            end_time=slice_item.end_time,
+            type=slice_item.type,
+            text_content=slice_item.text_content,
+            visual_analysis=vis_res
+        )
+
+    @staticmethod
+    def _format_slice_log_line(s: AnnotatedSliceResult, lang: str) -> str:
+        """单条切片日志行：一次 f-string 成行；字幕仅在含换行时才做替换 (多数字幕为单行)"""
+        text = s.text_content
+        if text:
+            if "\n" in text:
+                text = text.replace("\n", " ")
+            text_part = f"📖[SUB]: {text.strip()}"
+        else:
+            text_part = "🔇[NO_TEXT]"
+        v = s.visual_analysis
+        if v:
+            vis_part = (f"📷[VIS]: {get_localized_term(v.shot_type, lang)} | {v.subject} | {v.action} | "
+                        f"{get_localized_term(v.mood, lang)}")
+        else:
+            vis_part = ""
+        return f"[Slice {s.slice_id}] ({s.start_time:.1f}s-{s.end_time:.1f}s) {text_part} {vis_part}"
+
+    def _semantic_grouping(self, chunk_slices: List[AnnotatedSliceResult], task_input: ScenePreAnnotatorPayload,
+                           chunk_no: int, total_chunks: int) -> tuple[List[SceneDefinition], Any]:
+        """
+        单个语义窗口的场景分组 (在线程池中执行)。
+        返回 (scenes, usage)；失败时记录错误并返回空结果，由调用方按窗口顺序统一编号与累计用量。
+        """
+        self.logger.info(f"Processing Semantic Chunk {chunk_no}/{total_chunks}...")
+        target_lang = task_input.lang
+        full_log_text = "\n".join(self._format_slice_log_line(s, target_lang) for s in chunk_slices)
+
+        prompt = self._build_prompt(self.prompts_dir, "scene_segmentation", task_input.lang,
+                                    slice_log=full_log_text)
+        try:
+            seg_resp, seg_usage = self.gemini_processor.generate_content(
+                model_name=task_input.text_model,
+                prompt=prompt,
+                response_schema=SceneSegmentationResponse,
+                temperature=0.1
+            )
+        except Exception as e:
+            self.logger.error(f"Stage 2 failed for chunk {chunk_no}: {e}")
+            return [], None
+        return (seg_resp.scenes if seg_resp and seg_resp.scenes else []), seg_usage
+
     def execute(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         self.logger.info("🚀 Starting Scene Pre-Annotation (V3.7 Process Control)...")
 
@@ -164,134 +289,126 @@ class ScenePreAnnotatorService(AIServiceMixin):
         total_usage_accumulator = {}
         annotated_slices: List[AnnotatedSliceResult] = []
 
-        # =====================================================
-        # Stage 1: 视觉推理 (带结果和Usage双重断点续传)
-        # =====================================================
-        if task_input.injected_annotated_slices:
-            self.logger.info(f"⚡ CACHE HIT: Using {len(task_input.injected_annotated_slices)} injected slices.")
-            annotated_slices = task_input.injected_annotated_slices
-        else:
-            total_slices = len(task_input.slices)
-
-            # 1. 加载双重断点
-            ckpt_results_raw, ckpt_usages_raw = self._load_checkpoints()
+        # [Perf] Stage 1 / Stage 2 流水线：两个阶段共用同一线程池。某个语义窗口 (SEMANTIC_BATCH_SIZE 个切片)
+        # 覆盖到的视觉推理 Batch 全部结束后，立即提交该窗口的语义分组，不再等待全部视觉推理完成。
+        # 场景编号在所有窗口返回后按窗口顺序统一分配，输出顺序与串行执行一致。
+        window_size = self.SEMANTIC_BATCH_SIZE
+        window_slices: Dict[int, List[AnnotatedSliceResult]] = {}
+        semantic_futures: Dict[int, Future] = {}
+
+        def submit_window(w: int, items: List[AnnotatedSliceResult], total_windows: int):
+            # 首个语义窗口真正提交时才输出 Stage 2 标题，日志顺序与实际执行一致
+            if not semantic_futures:
+                self.logger.info(f"--- Stage 2: Semantic Grouping (Chunk Size={window_size}, pipelined) ---")
+            window_slices[w] = items
+            semantic_futures[w] = executor.submit(self._semantic_grouping, items, task_input, w + 1, total_windows)
+
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+            # =====================================================
+            # Stage 1: 视觉推理 (带结果和Usage双重断点续传)
+            # =====================================================
+            if task_input.injected_annotated_slices:
+                self.logger.info(f"⚡ CACHE HIT: Using {len(task_input.injected_annotated_slices)} injected slices.")
+                annotated_slices = task_input.injected_annotated_slices
+            else:
+                total_slices = len(task_input.slices)
+                total_windows = math.ceil(total_slices / window_size)
 
-            visual_results_map = {}
-            # 恢复结果
-            for k, v in ckpt_results_raw.items():
-                try:
-                    visual_results_map[int(k)] = VisualAnalysisOutput(**v)
-                except:
-                    pass
+                # 1. 加载双重断点 (结果已恢复为 {slice_id: VisualAnalysisOutput})
+                visual_results_map, ckpt_usages_raw = self._load_checkpoints()
 
-            # [关键] 恢复之前的 Usage，确保断点续传时成本不归零
-            # 我们将 usage 存储为 "batch_index": usage_dict 的形式，或者简单累加？
-            # 简单策略：遍历 ckpt_usages_raw (key=slice_id_start, value=usage_dict) 并累加
-            for _, u_dict in ckpt_usages_raw.items():
-                self._aggregate_usage(total_usage_accumulator, u_dict)
+                # [关键] 恢复之前的 Usage，确保断点续传时成本不归零
+                # 简单策略：遍历 ckpt_usages_raw (key=slice_id_start, value=usage_dict) 并累加
+                for _, u_dict in ckpt_usages_raw.items():
+                    self._aggregate_usage(total_usage_accumulator, u_dict)
 
-            if len(visual_results_map) > 0:
-                self.logger.info(
-                    f"🔄 Resuming: {len(visual_results_map)}/{total_slices} slices done. Accumulated Cost recovered.")
+                if len(visual_results_map) > 0:
+                    self.logger.info(
+                        f"🔄 Resuming: {len(visual_results_map)}/{total_slices} slices done. Accumulated Cost recovered.")
 
-            slices_to_process = [s for s in task_input.slices if s.slice_id not in visual_results_map]
+                def annotate_window(w: int) -> List[AnnotatedSliceResult]:
+                    return [
+                        self._annotate_slice(slice_item, visual_results_map.get(slice_item.slice_id))
+                        for slice_item in task_input.slices[w * window_size:(w + 1) * window_size]
+                    ]
 
-            if slices_to_process:
-                self.logger.info(f"--- Stage 1: Processing {len(slices_to_process)} remote slices ---")
+                slices_to_process = [s for s in task_input.slices if s.slice_id not in visual_results_map]
 
+                # 每个语义窗口尚未结束的视觉推理 Batch 数；为 0 即可提交语义分组
                 chunks = [slices_to_process[i:i + self.VISUAL_BATCH_SIZE] for i in
                           range(0, len(slices_to_process), self.VISUAL_BATCH_SIZE)]
-
-                with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
-                    future_to_chunk = {
-                        executor.submit(
-                            self._batch_visual_inference,
-                            chunk, task_input.lang, task_input.visual_model, task_input.video_title
-                        ): chunk for chunk in chunks
-                    }
-
-                    completed_batches = 0
-                    for future in as_completed(future_to_chunk):
-                        chunk_data = future_to_chunk[future]
-                        try:
-                            batch_res, batch_usage = future.result()
-                            visual_results_map.update(batch_res)
-                            self._aggregate_usage(total_usage_accumulator, batch_usage)
-
-                            # Update Checkpoints
-                            for k, v in batch_res.items():
-                                ckpt_results_raw[str(k)] = v.model_dump()
-
-                            # Usage 记录：为了防止重复累加，我们以该 Batch 的第一个 Slice ID 为 Key 存储 Usage
-                            if batch_res:
-                                first_id = str(list(batch_res.keys())[0])
-                                ckpt_usages_raw[first_id] = batch_usage
-
-                            self._save_checkpoints(ckpt_results_raw, ckpt_usages_raw)
-
-                            completed_batches += 1
-                            self.logger.info(f"✅ Batch {completed_batches}/{len(chunks)} Completed.")
-                        except Exception as exc:
-                            self.logger.error(f"❌ Inference Exception: {exc}")
-
-            # 组装
-            for slice_item in task_input.slices:
-                vis_res = visual_results_map.get(slice_item.slice_id)
-                annotated_item = AnnotatedSliceResult(
-                    slice_id=slice_item.slice_id,
-                    start_time=slice_item.start_time,
-                    end_time=slice_item.end_time,
-                    type=slice_item.type,
-                    text_content=slice_item.text_content,
-                    visual_analysis=vis_res
-                )
-                annotated_slices.append(annotated_item)
-
-        # =====================================================
-        # Stage 2: 语义重组 (Gemini API)
-        # =====================================================
-        # (这部分代码保持不变，请直接使用 V3.6 的 Stage 2 代码)
-        self.logger.info(f"--- Stage 2: Semantic Grouping (Chunk Size={self.SEMANTIC_BATCH_SIZE}) ---")
-
-        target_lang = task_input.lang
-        all_scenes = []
-        global_scene_index = 1
-        semantic_chunks = [annotated_slices[i:i + self.SEMANTIC_BATCH_SIZE] for i in
-                           range(0, len(annotated_slices), self.SEMANTIC_BATCH_SIZE)]
-
-        for i, chunk_slices in enumerate(semantic_chunks):
-            self.logger.info(f"Processing Semantic Chunk {i + 1}/{len(semantic_chunks)}...")
-            slice_log_lines = []
-            for s in chunk_slices:
-                time_str = f"({s.start_time:.1f}s-{s.end_time:.1f}s)"
-                text_part = f"📖[SUB]: {s.text_content.replace(chr(10), ' ').strip()}" if s.text_content else "🔇[NO_TEXT]"
-                vis_part = ""
-                if s.visual_analysis:
-                    v = s.visual_analysis
-                    shot_str = get_localized_term(v.shot_type, target_lang)
-                    mood_str = get_localized_term(v.mood, target_lang)
-                    vis_part = f"📷[VIS]: {shot_str} | {v.subject} | {v.action} | {mood_str}"
-                line = f"[Slice {s.slice_id}] {time_str} {text_part} {vis_part}"
-                slice_log_lines.append(line)
-            full_log_text = "\n".join(slice_log_lines)
-
-            prompt = self._build_prompt(self.prompts_dir, "scene_segmentation", task_input.lang,
-                                        slice_log=full_log_text)
-            try:
-                seg_resp, seg_usage = self.gemini_processor.generate_content(
-                    model_name=task_input.text_model,
-                    prompt=prompt,
-                    response_schema=SceneSegmentationResponse,
-                    temperature=0.1
-                )
+                position = {s.slice_id: idx for idx, s in enumerate(task_input.slices)}
+                chunk_windows = [{position[s.slice_id] // window_size for s in chunk} for chunk in chunks]
+                pending_batches = [0] * total_windows
+                for windows in chunk_windows:
+                    for w in windows:
+                        pending_batches[w] += 1
+
+                for w in range(total_windows):
+                    if pending_batches[w] == 0:
+                        submit_window(w, annotate_window(w), total_windows)
+
+                if slices_to_process:
+                    self.logger.info(f"--- Stage 1: Processing {len(slices_to_process)} remote slices ---")
+
+                    # [Perf] 指令在进入线程池前构建一次，不在每个 Batch 内重复格式化
+                    instruction = self._build_visual_instruction(task_input.lang, task_input.video_title)
+
+                    # 断点日志在整个 Stage 1 期间保持打开 (无缓冲追加)，每个 Batch 只追加自身记录
+                    # [Perf] 单线程写入器：序列化 + fsync 移出结果消费循环，单 worker 保证追加顺序；
+                    # 退出 with 时先等待写入器清空队列，再关闭日志文件，保证进入 Stage 2 收尾前断点已落盘
+                    with open(self.checkpoint_log_path, 'ab', buffering=0) as ckpt_log, \
+                            ThreadPoolExecutor(max_workers=1) as ckpt_writer:
+                        future_to_windows = {
+                            executor.submit(
+                                self._batch_visual_inference,
+                                chunk, instruction, task_input.visual_model
+                            ): windows for chunk, windows in zip(chunks, chunk_windows)
+                        }
+
+                        completed_batches = 0
+                        for future in as_completed(future_to_windows):
+                            try:
+                                batch_res, batch_usage = future.result()
+                                visual_results_map.update(batch_res)
+                                self._aggregate_usage(total_usage_accumulator, batch_usage)
+
+                                # Update Checkpoints (异步追加本 Batch 记录；batch_res 之后不再被修改)
+                                ckpt_writer.submit(self._append_checkpoint, ckpt_log, batch_res, batch_usage)
+
+                                completed_batches += 1
+                                self.logger.info(f"✅ Batch {completed_batches}/{len(chunks)} Completed.")
+                            except Exception as exc:
+                                self.logger.error(f"❌ Inference Exception: {exc}")
+
+                            # 无论成功与否，该 Batch 已结束：其覆盖的窗口若已无待完成 Batch，立即进入语义分组
+                            for w in future_to_windows[future]:
+                                pending_batches[w] -= 1
+                                if pending_batches[w] == 0:
+                                    submit_window(w, annotate_window(w), total_windows)
+
+                # 组装 (按窗口顺序拼接，窗口内即原始切片顺序)
+                for w in range(total_windows):
+                    annotated_slices.extend(window_slices[w])
+
+            # =====================================================
+            # Stage 2: 语义重组 (Gemini API)
+            # =====================================================
+            # 注入路径 (无 Stage 1) 的窗口在此统一提交
+            if not semantic_futures:
+                windows = [annotated_slices[i:i + window_size] for i in range(0, len(annotated_slices), window_size)]
+                for w, items in enumerate(windows):
+                    submit_window(w, items, len(windows))
+
+            all_scenes = []
+            global_scene_index = 1
+            for w in range(len(semantic_futures)):
+                scenes, seg_usage = semantic_futures[w].result()
                 self._aggregate_usage(total_usage_accumulator, seg_usage)
-                if seg_resp and seg_resp.scenes:
-                    for scene in seg_resp.scenes:
-                        scene.index = global_scene_index
-                        global_scene_index += 1
-                        all_scenes.append(scene)
-            except Exception as e:
-                self.logger.error(f"Stage 2 failed for chunk {i + 1}: {e}")
+                for scene in scenes:
+                    scene.index = global_scene_index
+                    global_scene_index += 1
+                    all_scenes.append(scene)
 
         # Report
         pricing_model = task_input.visual_model
@@ -2,12 +2,14 @@ import json
 import shutil
 import subprocess
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 from pathlib import Path
 from typing import Dict, Any, List
 
 from PIL import Image
 from django.conf import settings
+from pydantic import TypeAdapter
 
 from ai_services.ai_platform.llm.gemini_processor import GeminiProcessor
 from ai_services.ai_platform.llm.cost_calculator import CostCalculator
@@ -19,6 +21,9 @@ from .schemas import (
     VisualAnalysisPayload, VisualAnalysisResult, RawSlice, VisualTag, RefinedSlice
 )
 
+# [Perf] 模块级预编译：整批切片一次校验，不逐条构造
+_RAW_SLICE_LIST_ADAPTER = TypeAdapter(List[RawSlice])
+
 
 class VisualAnalysisService(AIServiceMixin):
     """
@@ -29,6 +34,9 @@ class VisualAnalysisService(AIServiceMixin):
     3. 聚合输出: 生成供 Workbench 使用的最终 Timeline。
     """
 
+    # 截图预取并发数 (ffmpeg 子进程，等待期间不占 GIL)
+    FRAME_EXTRACT_WORKERS = 4
+
     def __init__(self,
                  logger,
                  gemini_processor: GeminiProcessor,
@@ -62,7 +70,7 @@ class VisualAnalysisService(AIServiceMixin):
         # 3. 加载 Raw Slices
         with open(raw_json_full_path, 'r', encoding='utf-8') as f:
             raw_data = json.load(f)
-            raw_slices = [RawSlice(**s) for s in raw_data.get("slices", [])]
+            raw_slices = _RAW_SLICE_LIST_ADAPTER.validate_python(raw_data.get("slices", []))
             total_duration = raw_data.get("total_duration", 0.0)
 
         total_usage = {}  # 用于累计 Token 消耗
@@ -74,14 +82,15 @@ class VisualAnalysisService(AIServiceMixin):
 
         visual_prompt_tpl = self._load_prompt_template(task_input.lang, "visual_tagging")
 
+        frame_paths = self._prefetch_frames(video_full_path, raw_slices)
+
         processed_slices = []
         for idx, slice_item in enumerate(raw_slices):
             # 必须使用 model_copy，否则修改会影响原始对象引用
             current_slice = slice_item.model_copy()
 
             if current_slice.processing_strategy == "visual_inference":
-                mid_point = (current_slice.start_time + current_slice.end_time) / 2
-                frame_path = self._extract_frame(video_full_path, mid_point, idx)
+                frame_path = frame_paths.get(idx)
 
                 if frame_path:
                     # 记录缩略图路径 (相对路径，供前端访问)
@@ -215,6 +224,21 @@ class VisualAnalysisService(AIServiceMixin):
             return p
         return settings.SHARED_ROOT / p
 
+    def _prefetch_frames(self, video_path: Path, raw_slices: List[RawSlice]) -> Dict[int, Path]:
+        """
+        [Perf] 在逐条 VLM 推理前，并行抽取所有 visual_inference 切片的中点截图。
+        返回 {切片下标: 截图路径 (失败为 None)}，与原先逐条抽取的结果一致。
+        """
+        targets = [
+            (idx, (s.start_time + s.end_time) / 2)
+            for idx, s in enumerate(raw_slices) if s.processing_strategy == "visual_inference"
+        ]
+        if not targets:
+            return {}
+        with ThreadPoolExecutor(max_workers=self.FRAME_EXTRACT_WORKERS) as pool:
+            paths = pool.map(lambda t: self._extract_frame(video_path, t[1], t[0]), targets)
+            return {idx: path for (idx, _), path in zip(targets, paths)}
+
     def _extract_frame(self, video_path: Path, timestamp: float, idx: int) -> Path:
         """FFmpeg 截图"""
         out_name = f"frame_{video_path.stem}_{timestamp:.2f}_{idx}.jpg"
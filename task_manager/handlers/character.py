@@ -56,11 +56,8 @@ class CharacterHandler(BaseTaskHandler):
 
         # --- [Step 2: 加载并校验 NarrativeDataset] ---
         try:
-            with input_path.open('r', encoding='utf-8') as f:
-                raw_data = json.load(f)
-
             # [Strict Mode]
-            dataset = NarrativeDataset(**raw_data)
+            dataset = NarrativeDataset.from_bytes(input_path.read_bytes())
             self.logger.info(f"NarrativeDataset loaded successfully. Scenes: {len(dataset.scenes)}")
 
         except Exception as e:
@@ -56,9 +56,7 @@ class DubbingHandler(BaseTaskHandler):
             with narration_path.open('r', encoding='utf-8') as f:
                 narration_data = json.load(f)
 
-            with blueprint_path.open('r', encoding='utf-8') as f:
-                dataset_raw = json.load(f)
-            dataset_obj = NarrativeDataset(**dataset_raw)
+            dataset_obj = NarrativeDataset.from_bytes(blueprint_path.read_bytes())
         except Exception as e:
             raise BizException(ErrorCode.FILE_IO_ERROR, msg=f"Failed to load input data: {e}")
 
@@ -1,5 +1,6 @@
-import json
 from pathlib import Path
+
+import orjson
 from django.conf import settings
 from task_manager.models import Task
 from task_manager.handlers.base import BaseTaskHandler
@@ -42,12 +43,8 @@ class EditingScriptHandler(BaseTaskHandler):
 
         # 3. 加载数据
         try:
-            with dubbing_path.open(encoding='utf-8') as f:
-                dubbing_data = json.load(f)
-
-            with blueprint_path.open(encoding='utf-8') as f:
-                dataset_raw = json.load(f)
-            dataset_obj = NarrativeDataset(**dataset_raw)
+            dubbing_data = orjson.loads(dubbing_path.read_bytes())
+            dataset_obj = NarrativeDataset.from_bytes(blueprint_path.read_bytes())
         except Exception as e:
             raise BizException(ErrorCode.FILE_IO_ERROR, msg=f"Failed to load inputs: {e}")
 
@@ -64,20 +61,23 @@ class EditingScriptHandler(BaseTaskHandler):
             localization_path=settings.BASE_DIR / 'ai_services' / 'biz_services' / 'editing' / 'localization' / 'broll_selector_service.json',
             logger=self.logger,
             work_dir=settings.SHARED_TMP_ROOT / f"editing_{task.id}_workspace",
-            gemini_processor=gemini_processor
+            gemini_processor=gemini_processor,
+            # [Cache] LLM 选择缓存按媒资共享 (条目键为 模型 + Prompt 摘要)，重跑任务 (新 Task ID) 仍可命中
+            llm_cache_dir=settings.SHARED_TMP_ROOT / "editing_llm_cache" / str(dataset_obj.asset_uuid)
         )
 
         # 5. 执行
-        result_data = service.execute(
+        result = service.execute(
             dubbing_data=dubbing_data,
             dataset=dataset_obj,
-            config=payload_obj.service_params
+            config=payload_obj.service_params,
+            return_format='model'
         )
 
         # 6. 保存结果
+        # [Perf] 模型直接序列化为 bytes 落盘，不经过 model_dump 中间 dict 与 orjson 二次序列化
         output_path.parent.mkdir(parents=True, exist_ok=True)
-        with output_path.open('w', encoding='utf-8') as f:
-            json.dump(result_data, f, ensure_ascii=False, indent=2)
+        output_path.write_bytes(result.to_bytes(indent=2))
 
         # 7. 返回相对路径
         try:
@@ -88,5 +88,5 @@ class EditingScriptHandler(BaseTaskHandler):
         return {
             "message": "Editing script generated.",
             "output_file_path": str(rel_output),
-            "total_sequences": result_data.get("total_sequences", 0)
+            "total_sequences": result.total_sequences
         }
\ No newline at end of file
@@ -53,9 +53,7 @@ class LocalizationHandler(BaseTaskHandler):
 
             # --- [Step 3: 加载 Dataset] ---
             try:
-                with blueprint_path.open('r', encoding='utf-8') as f:
-                    raw_data = json.load(f)
-                dataset_obj = NarrativeDataset(**raw_data)
+                dataset_obj = NarrativeDataset.from_bytes(blueprint_path.read_bytes())
             except Exception as e:
                 raise BizException(ErrorCode.PAYLOAD_VALIDATION_ERROR, msg=f"Invalid NarrativeDataset: {e}")
 
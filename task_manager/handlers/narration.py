@@ -1,4 +1,5 @@
 import json
+import orjson
 import yaml
 from pathlib import Path
 from django.conf import settings
@@ -47,13 +48,13 @@ class NarrationHandler(BaseTaskHandler):
         # 直接加载 NarrativeDataset，废弃旧的 BlueprintConverter
         try:
             blueprint_path = Path(payload_obj.absolute_blueprint_path)
-            with blueprint_path.open(encoding='utf-8') as f:
-                raw_data = json.load(f)
+            # [Perf] orjson 直接解析 bytes，大体积 Dataset 冷启动解析更快
+            raw_data = orjson.loads(blueprint_path.read_bytes())
 
             # [Strict Mode Check]
             # 强校验：输入文件必须完全符合 NarrativeDataset 标准
             # 这一步会触发 Pydantic 校验，如果数据不合法（如缺字段），直接抛出异常
-            dataset_obj = NarrativeDataset(**raw_data)
+            dataset_obj = NarrativeDataset.from_raw(raw_data)
             self.logger.info(f"NarrativeDataset loaded successfully. Scenes: {len(dataset_obj.scenes)}")
 
         except Exception as e:
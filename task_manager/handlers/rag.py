@@ -1,6 +1,5 @@
 # task_manager/handlers/rag.py
 
-import json
 from pathlib import Path
 from django.conf import settings
 from task_manager.models import Task
@@ -47,10 +46,8 @@ class RagDeploymentHandler(BaseTaskHandler):
         # --- [Step 2: 预加载 Dataset 以获取元数据] ---
         # 我们需要在部署前拿到 asset_id，以便生成 Corpus Name
         try:
-            with blueprint_path.open( encoding='utf-8') as f:
-                raw_data = json.load(f)
             # 这里的加载也是一次“格式检查”
-            dataset = NarrativeDataset(**raw_data)
+            dataset = NarrativeDataset.from_bytes(blueprint_path.read_bytes())
         except Exception as e:
             raise BizException(ErrorCode.PAYLOAD_VALIDATION_ERROR, msg=f"Invalid NarrativeDataset: {e}")
 
@@ -7,7 +7,7 @@ import re
 import json
 import logging
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Set, Tuple
 
 # 将项目根目录添加到Python路径中
 project_root = Path(__file__).resolve().parents[3]
@@ -16,8 +16,16 @@ sys.path.append(str(project_root))
 # 导入引导程序
 from tests.lib.bootstrap import bootstrap_local_env_and_logger
 # 导入 Schema 用于生成标准化的 RAG 文本格式
+# [Known Issue] 当前 rag.schemas 已无 Scene / load_i18n_strings (已迁移至 NarrativeScene + RagContentFormatter)，
+# 本脚本在导入阶段即失败，需随 V6 蓝图格式整体重写后才能运行。
 from ai_services.ai_platform.rag.schemas import Scene, load_i18n_strings
 
+# 预编译: 从 GCS URI 中提取 Scene ID (_scene_{数字}_enhanced.txt)
+_SCENE_URI_RE = re.compile(r"_scene_(\d+)_enhanced\.txt")
+# 重组上下文时场景之间的分隔符；_SCENE_JOINER 为相邻场景之间实际插入的完整片段 (含前后换行)
+_SCENE_SEPARATOR = "\n" + "=" * 30 + "\n"
+_SCENE_JOINER = "\n" + _SCENE_SEPARATOR + "\n"
+
 
 class MockRagContext:
     """模拟 RAG 返回的 Context 对象"""
@@ -36,11 +44,23 @@ class ContextEnhancer:
 
     def __init__(self, blueprint_path: Path, logger: logging.Logger):
         self.logger = logger
-        self.blueprint_data = self._load_blueprint(blueprint_path)
+        # 原始蓝图只在初始化阶段读取，不挂在实例上：需要的部分直接引用，不额外保留整棵 dict 树
+        blueprint_data = self._load_blueprint(blueprint_path)
 
         # 预处理：建立 narrative_index 到 scene_id 的映射，以及 scene_id 到 Scene 对象的映射
-        self.timeline_map = self._build_timeline_map()
-        self.scenes_map = self.blueprint_data.get("scenes", {})
+        self.timeline_map = self._build_timeline_map(blueprint_data.get("narrative_timeline", {}))
+        # JSON 中 scenes 的 key 是 str，这里统一转成 int，与提取出的 scene_id / timeline_map 同类型
+        self.scenes_map: Dict[int, Dict] = {
+            int(k): v for k, v in blueprint_data.get("scenes", {}).items() if k.isdigit()
+        }
+        self.series_name = blueprint_data.get("project_metadata", {}).get("project_name", "Unknown")
+        # 场景 -> 集数 (chapter_id) 映射，范围过滤时直接查表
+        self._chapter_of: Dict[int, int] = {
+            sid: scene_data.get("chapter_id") or 0 for sid, scene_data in self.scenes_map.items()
+        }
+        self._scope_cache: Dict[Tuple[int, int], Set[int]] = {}
+        # 蓝图加载后不再变化：Scene 对象在初始化时构建一次，enhance 中直接查表
+        self.scene_objs = self._build_scene_objs()
 
         # 加载 i18n 字符串，以便调用 Scene.to_rag_text
         # 注意：这里假设 localization 文件在标准位置，或者我们需要 mock 它
@@ -52,9 +72,8 @@ class ContextEnhancer:
         with path.open("r", encoding="utf-8") as f:
             return json.load(f)
 
-    def _build_timeline_map(self) -> Dict[int, int]:
+    def _build_timeline_map(self, narrative_timeline: Dict) -> Dict[int, int]:
         """构建 {narrative_index: scene_id} 的有序映射"""
-        timeline = self.blueprint_data.get("narrative_timeline", {}).get("sequence", {})
         # 这里的结构是 "1": {"narrative_index": 1}, 假设 key 就是顺序
         # 实际上我们需要确认 narrative_index 的含义。
         # 根据您提供的数据："1": {"narrative_index": 1}，且描述说 index 对应 Scene ID?
@@ -65,7 +84,7 @@ class ContextEnhancer:
         # 让我们建立一个从 scene_id 到 sort_order 的反向映射，用于排序
 
         scene_id_to_rank = {}
-        sequence = self.blueprint_data.get("narrative_timeline", {}).get("sequence", {})
+        sequence = narrative_timeline.get("sequence", {})
 
         # 假设 sequence 的 key 就是场景 ID (从数据看 "1": {"narrative_index": 1}，场景ID也是1)
         # 我们用 narrative_index 作为排序依据
@@ -79,13 +98,26 @@ class ContextEnhancer:
                 continue
         return scene_id_to_rank
 
+    def _build_scene_objs(self) -> Dict[int, Scene]:
+        """构建 {scene_id: Scene} 映射 (蓝图已校验，使用 model_construct)"""
+        return {sid: Scene.model_construct(**scene_data) for sid, scene_data in self.scenes_map.items()}
+
+    def _sids_in_scope(self, start_ep: int, end_ep: int) -> Set[int]:
+        """第 start_ep-end_ep 集内的场景 ID 集合 (蓝图不变，按范围缓存)"""
+        key = (start_ep, end_ep)
+        sids = self._scope_cache.get(key)
+        if sids is None:
+            sids = {sid for sid, chapter_id in self._chapter_of.items() if start_ep <= chapter_id <= end_ep}
+            self._scope_cache[key] = sids
+        return sids
+
     def extract_scene_id(self, source_uri: str) -> int:
         """
         关键逻辑：从 GCS URI 中提取 Scene ID。
         URI 样例: .../总裁的契约女友_v3_scene_16_enhanced.txt
         """
         # 正则匹配 _scene_{数字}_enhanced.txt
-        match = re.search(r"_scene_(\d+)_enhanced\.txt", source_uri)
+        match = _SCENE_URI_RE.search(source_uri)
         if match:
             return int(match.group(1))
         return None
@@ -96,59 +128,62 @@ class ContextEnhancer:
         """
         self.logger.info(">>> 开始执行 Context 增强流程...")
 
-        # 1. 提取 ID 并去重
-        hit_scene_ids = set()
-        for chunk in retrieved_chunks:
-            sid = self.extract_scene_id(chunk.source_uri)
-            if sid:
-                hit_scene_ids.add(sid)
-            else:
-                self.logger.warning(f"无法解析 URI: {chunk.source_uri}")
-
-        self.logger.info(f"RAG 命中场景 ID (去重后): {hit_scene_ids}")
-
-        # 2. 范围过滤 (Scope Filtering)
+        # 1. 范围准备 (Scope)：episode_range 对应的场景集合按 (start, end) 缓存
         scope = config.get("control_params", {}).get("scope", {})
-        valid_scene_ids = []
-
+        scope_ids = None
         if scope.get("type") == "episode_range":
             start_ep, end_ep = scope.get("value", [1, 100])
             self.logger.info(f"应用范围过滤: 第 {start_ep}-{end_ep} 集")
+            scope_ids = self._sids_in_scope(start_ep, end_ep)
+
+        # 2. 单次遍历：提取 ID -> 去重 -> 范围过滤 -> 附带 rank
+        # 所有 URI 拼成一个字符串，一次 findall 完成提取 (URI 中不含换行，不会跨 URI 误匹配)
+        uris = [chunk.source_uri or "" for chunk in retrieved_chunks]
+        matched = _SCENE_URI_RE.findall("\n".join(uris))
+        if len(matched) < len(uris):
+            self.logger.warning(f"{len(uris) - len(matched)} 个 URI 无法解析出场景 ID")
+
+        timeline_map = self.timeline_map
+        seen = set()
+        dropped = []
+        ranked = []
+        for m in matched:
+            sid = int(m)
+            if not sid or sid in seen: continue
+            seen.add(sid)
+            # 蓝图中不存在或无集数的场景不在任何 episode_range 内，一并剔除
+            if scope_ids is not None and sid not in scope_ids:
+                dropped.append(sid)
+                continue
+            ranked.append((timeline_map.get(sid, 9999), sid))
+
+        self.logger.info(f"RAG 命中场景 ID (去重后): {seen}")
+        if dropped:
+            self.logger.info(f"场景 {sorted(dropped)} 超出范围，已剔除。")
 
-            # 遍历命中的场景，检查其 chapter_id (集数)
-            for sid in hit_scene_ids:
-                scene_data = self.scenes_map.get(str(sid))  # JSON key 是 str
-                if not scene_data: continue
-
-                chapter_id = scene_data.get("chapter_id")
-                if start_ep <= chapter_id <= end_ep:
-                    valid_scene_ids.append(sid)
-                else:
-                    self.logger.info(f"场景 {sid} (第 {chapter_id} 集) 超出范围，已剔除。")
-        else:
-            valid_scene_ids = list(hit_scene_ids)
-
-        # 3. 时序排序 (Timeline Sorting)
-        # 使用预构建的 rank map 进行排序
-        sorted_ids = sorted(valid_scene_ids, key=lambda x: self.timeline_map.get(x, 9999))
+        # 3. 时序排序 (Timeline Sorting)：rank 已在遍历中附带，排序时直接比较元组
+        ranked.sort()
+        sorted_ids = [sid for _, sid in ranked]
         self.logger.info(f"最终选定并排序的场景流: {sorted_ids}")
 
         # 4. 内容重组 (Reconstruction)
-        final_context_parts = []
-        series_name = self.blueprint_data.get("project_metadata", {}).get("project_name", "Unknown")
+        # 列表只放场景文本，分隔符在 join 时插入
+        rich_texts = []
+        series_name = self.series_name
 
         for sid in sorted_ids:
-            scene_data = self.scenes_map.get(str(sid))
-            # 将 dict 转换为 Pydantic Scene 对象，利用其 to_rag_text 方法生成标准文本
+            # 利用预构建 Scene 对象的 to_rag_text 方法生成标准文本
             # 注意：这里我们为了演示，先不处理 enhanced_facts，只处理基础信息
-            scene_obj = Scene(**scene_data)
+            scene_obj = self.scene_objs.get(sid)
+            if scene_obj is None: continue
 
             # 生成高质量文本
-            rich_text = scene_obj.to_rag_text(series_id=series_name, lang='zh')
-            final_context_parts.append(rich_text)
-            final_context_parts.append("\n" + "=" * 30 + "\n")  # 分隔符
+            rich_texts.append(scene_obj.to_rag_text(series_id=series_name, lang='zh'))
 
-        return "\n".join(final_context_parts)
+        if not rich_texts:
+            return ""
+        # 每个场景后都跟一个分隔符 (与逐个追加分隔符再以换行 join 的结果一致)
+        return _SCENE_JOINER.join(rich_texts) + "\n" + _SCENE_SEPARATOR
 
 
 def main():